@@ -0,0 +1,221 @@
+# asyncio based counterpart of the Collector.
+# Reads from the serial port through a non-blocking file descriptor reader on the event loop,
+# so one process can drive many devices without a thread per port.
+# Note that loop.add_reader needs a selector event loop, which is the default on Linux and macOS.
+
+import asyncio
+import time
+import numpy as np
+from serial import Serial
+from util import auto_select_serial_port
+from gesture_data import GestureData
+from collector import (
+    COMMAND_TIMEOUT,
+    MEASUREMENT_START,
+    RECALIBRATE,
+    SET_SAMPLE_RATE,
+    STANDARD_DURATION,
+    STANDARD_SAMPLING_RATE,
+)
+
+SAMPLE_TIMEOUT = 1 # Seconds without new samples before a measurement is considered stuck.
+CHUNK_SAMPLES = 64 # Samples per chunk yielded by the chunk iterator.
+SAMPLE_SIZE = 6 # Three uint16 readings per sample.
+READ_SIZE = 4096 # Maximum amount of bytes taken from the port per readable event.
+
+
+class AsyncCollector:
+
+    def __init__(self, serial_port: str = auto_select_serial_port(), baud_rate: int = 19200):
+        print("Connecting to gesture device at serial port", serial_port, "at baud rate", baud_rate)
+        self.serial_port = serial_port
+        self.connection = Serial(serial_port, baud_rate, timeout=0) # Never block on reads.
+        self.resistance = 0
+        self.achieved_sample_rate = None # Sample rate reached in the last measurement.
+
+        self._buffer = bytearray()
+        self._waiter = None
+        self._loop = None
+        self._lock = None
+        # Bytes of an interrupted measurement that are still on their way, or None if the stream is in sync.
+        self._pending = None
+        self._owed_replies = 0 # Replies of interrupted commands that are still on their way.
+
+
+    # Registers the file descriptor reader on the running loop, on first use.
+    def _attach(self) -> None:
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._loop.add_reader(self.connection.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        data = self.connection.read(READ_SIZE)
+        if data:
+            self._buffer += data
+            if self._waiter is not None and not self._waiter.done():
+                self._waiter.set_result(None)
+
+    # Waits until new bytes arrived, raises TimeoutError if nothing came in time.
+    async def _wait_for_data(self, timeout: float) -> None:
+        self._waiter = self._loop.create_future()
+        try:
+            await asyncio.wait_for(self._waiter, timeout)
+        finally:
+            self._waiter = None
+
+    async def _read_exactly(self, size: int, timeout: float = COMMAND_TIMEOUT) -> bytes:
+        while len(self._buffer) < size:
+            await self._wait_for_data(timeout)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def readline(self, timeout: float = COMMAND_TIMEOUT, log=False) -> str:
+        while b"\n" not in self._buffer:
+            await self._wait_for_data(timeout)
+        end = self._buffer.index(b"\n") + 1
+        line = bytes(self._buffer[:end]).decode("utf-8")
+        del self._buffer[:end]
+        if log:
+            print("[Serial] '" + line.strip() + "'")
+        return line
+
+    async def readint(self, timeout: float = COMMAND_TIMEOUT) -> int:
+        return int(await self.readline(timeout))
+
+    # Reads the reply to a command. If waiting for it is interrupted, the reply is discarded by _resync.
+    async def _reply(self, log=False) -> str:
+        self._owed_replies += 1
+        line = await self.readline(log=log)
+        self._owed_replies -= 1
+        return line
+
+    # Writes are only a couple of bytes, so they are handed to the port directly.
+    def write_bytes(self, *args) -> None:
+        if (self.connection.closed):
+            raise Exception("Serial connection is closed, cannot send data.")
+        self.connection.write(b"".join(bytes([arg]) if isinstance(arg, int) else arg.tobytes() for arg in args))
+
+    # Brings the stream back in sync after a measurement was cancelled or timed out.
+    async def _resync(self) -> None:
+        if self._pending is None and self._owed_replies == 0:
+            return
+        pending, self._pending = self._pending, None
+        owed, self._owed_replies = self._owed_replies, 0
+        try:
+            # Let the device finish the measurement or command and discard what it sends.
+            if pending is not None:
+                remaining, sample_rate = pending
+                await self._read_exactly(remaining, SAMPLE_TIMEOUT + remaining / SAMPLE_SIZE / sample_rate)
+                await self.readline()
+            for _ in range(owed):
+                await self.readline()
+        except asyncio.TimeoutError:
+            print("Warning: could not resynchronise with device, discarding input.")
+            self._buffer.clear()
+            self.connection.reset_input_buffer()
+
+
+    async def recalibrate(self) -> int:
+        self._attach()
+        async with self._lock:
+            await self._resync()
+            return await self._recalibrate()
+
+    async def _recalibrate(self) -> int:
+        print("Recalibrating light sensitivty of device.")
+        self.write_bytes(RECALIBRATE)
+        self.resistance = int(await self._reply())
+        print("Resistance set to", self.resistance, "Ohms.")
+        return self.resistance
+
+    async def set_sample_rate(self, frequency: int) -> None:
+        self._attach()
+        async with self._lock:
+            await self._resync()
+            await self._set_sample_rate(frequency)
+
+    async def _set_sample_rate(self, frequency: int) -> None:
+        print("Setting sample frequency to", frequency, "Hz.")
+        self.write_bytes(SET_SAMPLE_RATE, np.uint16(frequency))
+        await self._reply(log=True)
+
+
+    async def measure(self, duration=STANDARD_DURATION, sample_rate=STANDARD_SAMPLING_RATE, log=False) -> GestureData:
+        data = GestureData(resistance=self.resistance, sample_rate=sample_rate, duration=duration)
+        data.device = self.serial_port
+
+        start = time.time()
+        async for chunk in self.chunks(data.samples, sample_rate):
+            data.data.extend(chunk.tolist())
+            if log:
+                print("[" + self.serial_port + "] Received", len(data.data), "of", data.samples, "samples")
+        diff = time.time() - start
+
+        # Resistance might have been set by the recalibration in chunks.
+        data.resistance = self.resistance
+        print("Measurement on", self.serial_port, "took", diff, "seconds. (expected " + str(duration) + " seconds)")
+        print("Achieved sampling rate of", self.achieved_sample_rate, "Hz. (expected " + str(sample_rate) + " Hz)  ")
+        return data
+
+    # Starts a measurement and yields the samples as (n, 3) uint16 arrays as soon as they arrive.
+    # Raises TimeoutError when the device stops sending; cancelling is safe at any point.
+    async def chunks(self, samples: int, sample_rate=STANDARD_SAMPLING_RATE, chunk_size=CHUNK_SAMPLES):
+        self._attach()
+        async with self._lock:
+            await self._resync()
+
+            if (self.resistance == 0):
+                print("Warning: resistance is not set. Recalibrating.")
+                await self._recalibrate()
+            await self._set_sample_rate(sample_rate)
+
+            self.write_bytes(MEASUREMENT_START, np.uint32(samples))
+            start = time.time()
+            remaining = samples * SAMPLE_SIZE
+            self._pending = (remaining, sample_rate)
+            try:
+                while remaining > 0:
+                    size = min(remaining, chunk_size * SAMPLE_SIZE)
+                    chunk = await self._read_exactly(size, SAMPLE_TIMEOUT + chunk_size / sample_rate)
+                    remaining -= size
+                    self._pending = (remaining, sample_rate)
+                    yield np.frombuffer(chunk, dtype=np.uint16).reshape(-1, 3)
+
+                # Confirm that the measurement is done.
+                await self.readline(log=True)
+                self._pending = None
+            finally:
+                self.achieved_sample_rate = (samples - remaining / SAMPLE_SIZE) / (time.time() - start)
+
+
+    def close(self) -> None:
+        if self._loop is not None and not self.connection.closed:
+            self._loop.remove_reader(self.connection.fileno())
+        self.connection.close()
+
+
+# If running as script, measure on the given ports (or on emulated devices) from a single thread.
+if __name__ == "__main__":
+    import sys
+    from emulator import DeviceEmulator
+
+    async def main(ports):
+        collectors = [AsyncCollector(port) for port in ports]
+        results = await asyncio.gather(*(collector.measure(duration=2, sample_rate=500) for collector in collectors))
+        for collector, data in zip(collectors, results):
+            print(collector.serial_port, "collected", len(data.data), "samples")
+            collector.close()
+
+    ports = sys.argv[1:]
+    emulators = []
+    if not ports:
+        emulators = [DeviceEmulator().start() for _ in range(3)]
+        ports = [emulator.port for emulator in emulators]
+
+    asyncio.run(main(ports))
+
+    for emulator in emulators:
+        emulator.stop()
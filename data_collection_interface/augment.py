@@ -0,0 +1,131 @@
+# Data augmentation for training on an export of the dataset (see export.py).
+# Batches of recordings are augmented at once: time warping and time shifts are combined into one
+# interpolation of the whole batch, followed by amplitude scaling, gain jitter per photodiode and noise.
+# Batches are made by worker processes that read the memory mapped export, a few batches ahead of
+# the training loop. Every batch has its own seed derived from the seed, epoch and batch number,
+# so the same settings always give the same batches, however many workers are used.
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from export import EXPORT_PATH, load_export
+
+BATCH_SIZE = 64
+PREFETCH = 4 # Batches being made ahead of the training loop.
+
+
+class Augmenter:
+    """Random augmentations of batches of shape (B, T, 3), set an augmentation to 0 to disable it.
+
+    warp: maximum relative change of the speed of the gesture, which varies smoothly over the recording.
+    shift: maximum shift of the recording in time, as a fraction of its length.
+    scale: maximum relative change of all readings, like a different resistance or lighting.
+    gain: standard deviation of the relative gain of every photodiode.
+    noise: standard deviation of the noise added to the readings.
+    """
+
+    def __init__(self, warp=0.2, shift=0.1, scale=0.2, gain=0.05, noise=2.0, knots=4):
+        self.warp = warp
+        self.shift = shift
+        self.scale = scale
+        self.gain = gain
+        self.noise = noise
+        self.knots = knots # Points between which the speed of a time warp changes linearly.
+
+    def augment(self, batch: np.ndarray, random: np.random.Generator) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+        size, length, _ = batch.shape
+
+        # Position in the original recording that every output sample is taken from.
+        positions = np.broadcast_to(np.arange(length, dtype=np.float32), (size, length))
+        if self.warp > 0:
+            knots = random.uniform(1 - self.warp, 1 + self.warp, (size, self.knots)).astype(np.float32)
+            speed = interpolate(knots[:, :, None], np.linspace(0, self.knots - 1, length)[None, :].repeat(size, 0))[:, :, 0]
+            warped = np.cumsum(speed, axis=1) - speed[:, :1]
+            positions = warped * ((length - 1) / np.maximum(warped[:, -1:], 1e-6)) # Keep the total duration.
+        if self.shift > 0:
+            positions = positions + random.uniform(-self.shift, self.shift, (size, 1)) * length
+        batch = interpolate(batch, positions)
+
+        if self.scale > 0:
+            batch *= random.uniform(1 - self.scale, 1 + self.scale, (size, 1, 1)).astype(np.float32)
+        if self.gain > 0:
+            batch *= random.normal(1, self.gain, (size, 1, 3)).astype(np.float32)
+        if self.noise > 0:
+            batch += random.normal(0, self.noise, batch.shape).astype(np.float32)
+        return batch
+
+
+# Linear interpolation of every recording at its own positions, positions outside the recording take the edge value.
+def interpolate(batch: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    length = batch.shape[1]
+    positions = np.clip(positions, 0, length - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, length - 1)
+    weight = (positions - lower).astype(np.float32)[:, :, None]
+    take = lambda indices: np.take_along_axis(batch, indices[:, :, None], axis=1)
+    return take(lower) * (1 - weight) + take(upper) * weight
+
+
+# The export and augmenter of a worker process, opened once per worker.
+_samples = None
+_labels = None
+_augmenter = None
+
+
+def _open(output: str, augmenter: Augmenter) -> None:
+    global _samples, _labels, _augmenter
+    _samples, metadata, _ = load_export(output)
+    _labels = np.array([int(row["label"]) for row in metadata])
+    _augmenter = augmenter
+
+
+# Runs in a worker process, reads and augments the recordings of one batch.
+def _make_batch(indices: np.ndarray, seed: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(indices) # The memory map is read fastest in order.
+    batch = np.empty((len(indices),) + _samples.shape[1:], dtype=np.float32)
+    batch[order] = _samples[indices[order]]
+    if _augmenter is not None:
+        batch = _augmenter.augment(batch, np.random.default_rng(seed))
+    return batch, _labels[indices]
+
+
+# Yields (samples, labels) batches of the export for the given amount of epochs.
+# Use augmenter=None to get the recordings as they are.
+def batches(output=EXPORT_PATH, batch_size=BATCH_SIZE, epochs=1, seed=0, augmenter: Augmenter = Augmenter(),
+            shuffle=True, workers: int = None, prefetch=PREFETCH):
+    _, metadata, _ = load_export(output)
+    count = len(metadata)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open, initargs=(output, augmenter)) as executor:
+        pending = []
+        for epoch in range(epochs):
+            order = np.random.default_rng([seed, epoch]).permutation(count) if shuffle else np.arange(count)
+            for number, start in enumerate(range(0, count, batch_size)):
+                pending.append(executor.submit(_make_batch, order[start:start + batch_size], [seed, epoch, number]))
+                if len(pending) > prefetch:
+                    yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+# If running as script, measure how fast augmented batches can be made from an export.
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate augmented batches from an export and report the throughput.")
+    parser.add_argument("--output", default=EXPORT_PATH, help="Folder of the export.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    recordings = batch_count = 0
+    for samples, labels in batches(args.output, args.batch_size, args.epochs, args.seed, workers=args.workers):
+        recordings += len(samples)
+        batch_count += 1
+    duration = time.time() - start
+    print("Made", batch_count, "batches of", samples.shape[1:], "in", round(duration, 2), "seconds,",
+          round(recordings / duration), "recordings per second.")
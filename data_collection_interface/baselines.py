@@ -0,0 +1,127 @@
+# Ambient baseline statistics per candidate, hand and photodiode.
+# Control recordings are made without performing a gesture, so they hold the ambient readings of
+# a candidate's setup. The statistics are computed once over all control recordings of a dataset
+# and cached, the cache is only recomputed when one of the control files changes.
+
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+from gesture_data import COLLECTION_PATH, read_pickle_dicts, stored_samples
+from loader import discover_files, format_candidate
+from export import fingerprint_files
+
+CONTROL_GESTURE = "control" # Target gesture (or folder) of the control recordings.
+ALL_HANDS = "all" # Statistics over the control recordings of both hands.
+BASELINES_PATH = "./baselines"
+PERCENTILES = [5, 25, 75, 95]
+
+
+# Lists the control files of a dataset.
+# In the collected dataset they are the recordings of the control gesture, stored as
+# <folder>/<gesture_type>/control/<hand>/candidate_<candidate>.pickle. Processed datasets
+# (see formatting_data.py) keep one file per candidate for all hands, as <folder>/control/<candidate>.pickle.
+def discover_control_files(folder=COLLECTION_PATH) -> list[dict]:
+    files = discover_files(folder, target_gesture=CONTROL_GESTURE)
+    for path in sorted(glob.glob(os.path.join(folder, CONTROL_GESTURE, "*.pickle"))):
+        candidate = os.path.basename(path)[:-len(".pickle")]
+        files.append({"path": path, "candidate": candidate, "hand": ALL_HANDS})
+    return files
+
+
+# Statistics of every photodiode over all samples of the given recordings.
+def compute_statistics(recordings: list[np.ndarray]) -> dict:
+    samples = np.concatenate([np.asarray(recording, dtype=np.float64) for recording in recordings])
+    median = np.median(samples, axis=0)
+    return {
+        "median": median.tolist(),
+        "mad": np.median(np.abs(samples - median), axis=0).tolist(), # Median absolute deviation.
+        "percentiles": dict(zip(map(str, PERCENTILES), np.percentile(samples, PERCENTILES, axis=0).tolist())),
+        "recordings": len(recordings),
+        "samples": len(samples),
+    }
+
+
+# Computes the statistics of every candidate and hand, as {candidate: {hand: statistics}}.
+# Every candidate also gets statistics over all its control recordings, under ALL_HANDS.
+def compute_baselines(files: list[dict]) -> dict:
+    groups = {}
+    for entry in files:
+        recordings = [stored_samples(obj) for obj in read_pickle_dicts(entry["path"])]
+        candidate = format_candidate(entry["candidate"])
+        groups.setdefault((candidate, entry["hand"]), []).extend(recordings)
+        if entry["hand"] != ALL_HANDS:
+            groups.setdefault((candidate, ALL_HANDS), []).extend(recordings)
+
+    baselines = {}
+    for (candidate, hand), recordings in groups.items():
+        if recordings:
+            baselines.setdefault(candidate, {})[hand] = compute_statistics(recordings)
+    return baselines
+
+
+class Baselines:
+    """Cached baseline statistics of the control recordings in a dataset.
+
+    The cache is a json file per dataset folder, which is rebuilt when a control file is added,
+    removed or changed. Lookups are done in memory, so using them costs nothing per recording.
+    """
+
+    def __init__(self, folder=COLLECTION_PATH, cache_folder=BASELINES_PATH):
+        self.folder = folder
+        name = hashlib.blake2b(os.path.abspath(folder).encode("utf-8"), digest_size=8).hexdigest()
+        self.cache_path = os.path.join(cache_folder, "baselines_" + name + ".json")
+        self.baselines = self._load()
+
+    def _load(self) -> dict:
+        files = discover_control_files(self.folder)
+        inputs = fingerprint_files([entry["path"] for entry in files])
+
+        try:
+            with open(self.cache_path) as file:
+                cached = json.load(file)
+            if cached["inputs"] == inputs:
+                return cached["baselines"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        print("Computing baselines of", len(files), "control files in '" + self.folder + "'")
+        baselines = compute_baselines(files)
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path + ".tmp", "w") as file:
+            json.dump({"folder": self.folder, "inputs": inputs, "baselines": baselines}, file)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+        return baselines
+
+    # Statistics of a candidate, or None if there are no control recordings of them.
+    def get(self, candidate: str, hand: str = ALL_HANDS) -> dict:
+        return self.baselines.get(format_candidate(candidate), {}).get(hand)
+
+    # Median ambient reading of every photodiode.
+    def median(self, candidate: str, hand: str = ALL_HANDS) -> np.ndarray:
+        statistics = self.get(candidate, hand)
+        if statistics is None:
+            raise Exception("No control recordings of candidate '" + candidate + "' (" + hand + ")")
+        return np.array(statistics["median"])
+
+    # Subtracts the median ambient reading and divides by the median absolute deviation.
+    # data has the photodiodes on its last axis, so whole batches can be normalised at once.
+    def normalise(self, data: np.ndarray, candidate: str, hand: str = ALL_HANDS) -> np.ndarray:
+        statistics = self.get(candidate, hand)
+        if statistics is None:
+            raise Exception("No control recordings of candidate '" + candidate + "' (" + hand + ")")
+        median = np.array(statistics["median"], dtype=np.float32)
+        scale = np.maximum(np.array(statistics["mad"], dtype=np.float32), 1) # Readings are integers, avoid dividing by zero.
+        return (np.asarray(data, dtype=np.float32) - median) / scale
+
+
+# If running as script, print the baselines of a dataset.
+if __name__ == "__main__":
+    import sys
+
+    baselines = Baselines(sys.argv[1] if len(sys.argv) > 1 else COLLECTION_PATH)
+    for candidate, hands in sorted(baselines.baselines.items()):
+        for hand, statistics in sorted(hands.items()):
+            print(candidate, hand, "median", statistics["median"], "mad", statistics["mad"],
+                  "(" + str(statistics["recordings"]) + " recordings)")
@@ -0,0 +1,193 @@
+# Many recordings in one container, for computations over the whole dataset.
+# The samples of all recordings are concatenated into a single (total samples, 3) uint16 array, with an
+# offsets index of where every recording starts. The metadata is kept in a column (array) per key.
+# Recordings are views into the samples, so selecting and grouping work on the columns, and statistics
+# over the dataset, a group or every recording are single numpy calls on the samples.
+
+import numpy as np
+from gesture_data import COLLECTION_PATH, GestureData
+
+# Metadata columns and their types, strings are stored as fixed width unicode arrays.
+# The types match those of GestureData, so a recording taken out of a batch keeps its fingerprint.
+# Missing (None) values are stored as "" in string columns and as nan in float columns.
+COLUMNS = {
+    "timestamp": np.float64,
+    "session": np.float64,
+    "candidate": np.str_,
+    "hand": np.str_,
+    "gesture_type": np.str_,
+    "target_gesture": np.str_,
+    "resistance": np.int64,
+    "sample_rate": np.int64,
+    "duration": np.float64,
+    "dropped_samples": np.int64,
+    "device": np.str_,
+    "hash": np.str_,
+}
+
+
+class GestureBatch:
+    """Recordings as one concatenated sample array, an offsets index and metadata columns.
+
+    batch[i] is a view of the samples of recording i, batch[mask], batch[indices] and batch[start:end]
+    select recordings into a new batch. Columns are available as batch.columns[name] and as batch.<name>.
+    """
+
+    def __init__(self, samples: np.ndarray, offsets: np.ndarray, columns: dict):
+        self.samples = samples
+        self.offsets = offsets # Start of every recording, followed by the total amount of samples.
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getattr__(self, name: str):
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            index = range(len(self))[index] # Supports negative indices, raises IndexError like a list.
+            return self.samples[self.offsets[index]:self.offsets[index + 1]]
+        return self.select(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    # Samples of every recording.
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    # Index of the recording of every sample, to combine per sample values per recording (e.g. with np.bincount).
+    def recording_of_samples(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    # New batch of the recordings at the given indices, boolean mask or slice. The samples are copied.
+    def select(self, index) -> "GestureBatch":
+        indices = np.arange(len(self))[index]
+        lengths = self.lengths[indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        # Position of every selected sample in this batch: the start of its recording plus its position in it.
+        positions = np.arange(offsets[-1]) + np.repeat(self.offsets[indices] - offsets[:-1], lengths)
+        columns = {name: column[indices] for name, column in self.columns.items()}
+        return GestureBatch(self.samples[positions], offsets, columns)
+
+    # Recordings of which every given column has the given value, or one of the values of a list.
+    def filter(self, **conditions) -> "GestureBatch":
+        mask = np.ones(len(self), dtype=bool)
+        for name, accepted in conditions.items():
+            if isinstance(accepted, (list, tuple, set)):
+                mask &= np.isin(self.columns[name], list(accepted))
+            else:
+                mask &= self.columns[name] == accepted
+        return self.select(mask)
+
+    # Splits the recordings into batches with the same values of the given columns.
+    # Returns {value: batch} for a single column, and {(value, ...): batch} for more.
+    def group_by(self, *names: str) -> dict:
+        keys = np.empty(len(self), dtype=[(name, self.columns[name].dtype) for name in names])
+        for name in names:
+            keys[name] = self.columns[name]
+        values, inverse = np.unique(keys, return_inverse=True)
+
+        # Sorting by group once gives the recordings of every group after each other.
+        order = np.argsort(inverse.ravel(), kind="stable")
+        splits = np.flatnonzero(np.diff(inverse.ravel()[order])) + 1
+        groups = {}
+        for value, indices in zip(values, np.split(order, splits)):
+            key = value.item() if len(names) > 1 else value.item()[0]
+            groups[key] = self.select(indices)
+        return groups
+
+    # The distinct values of a column and the index of the value of every recording, e.g. to use as labels.
+    def codes(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        values, codes = np.unique(self.columns[name], return_inverse=True)
+        return values, codes.ravel()
+
+    # Reduces the samples of every recording with a numpy ufunc (np.add, np.minimum, np.maximum, ...).
+    # Returns an (n, 3) array, recordings without samples get nan.
+    def reduce(self, ufunc) -> np.ndarray:
+        result = np.full((len(self), self.samples.shape[1]), np.nan)
+        filled = self.lengths > 0
+        if filled.any():
+            # Without the empty recordings, every start is followed by the start of the next recording.
+            result[filled] = ufunc.reduceat(self.samples.astype(np.float64), self.offsets[:-1][filled], axis=0)
+        return result
+
+    def means(self) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            return self.reduce(np.add) / self.lengths[:, None]
+
+    def minimums(self) -> np.ndarray:
+        return self.reduce(np.minimum)
+
+    def maximums(self) -> np.ndarray:
+        return self.reduce(np.maximum)
+
+    # Recording i as a GestureData, of which the data is a view into the samples.
+    def gesture_data(self, index: int) -> GestureData:
+        gd = GestureData(int(self.resistance[index]), int(self.sample_rate[index]), float(self.duration[index]))
+        gd.set({name: None if COLUMNS[name] is np.float64 and np.isnan(column[index]) else column[index].item()
+                for name, column in self.columns.items()})
+        gd.hash = gd.hash or None
+        gd.device = gd.device or None
+        gd.data = self[index]
+        gd.samples = len(gd.data)
+        return gd
+
+    # Collects recordings into a batch.
+    @staticmethod
+    def from_recordings(recordings: list[GestureData]) -> "GestureBatch":
+        data = [np.asarray(gd.data, dtype=np.uint16).reshape(-1, 3) for gd in recordings]
+        offsets = np.concatenate([[0], np.cumsum([len(samples) for samples in data], dtype=np.int64)])
+        samples = np.concatenate(data) if data else np.zeros((0, 3), dtype=np.uint16)
+
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            values = [getattr(gd, name) for gd in recordings]
+            if dtype is np.str_:
+                values = ["" if value is None else str(value) for value in values]
+            elif dtype is np.float64:
+                values = [np.nan if value is None else value for value in values]
+            columns[name] = np.array(values, dtype=dtype)
+        return GestureBatch(samples, offsets, columns)
+
+    # Loads the recordings of the dataset that match the filters into a batch, see loader.discover_files.
+    @staticmethod
+    def load(folder=COLLECTION_PATH, workers: int = None, **filters) -> "GestureBatch":
+        from loader import discover_files, load_files
+
+        paths = [entry["path"] for entry in discover_files(folder, **filters)]
+        recordings = [gd for _, file_recordings in load_files(paths, workers) for gd in file_recordings]
+        return GestureBatch.from_recordings(recordings)
+
+
+# If running as script, load the dataset into a batch and print statistics of it.
+if __name__ == "__main__":
+    import sys
+    import time
+    from loader import discover_files, load_files
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else COLLECTION_PATH
+    start = time.time()
+    batch = GestureBatch.load(folder)
+    print("Loaded", len(batch), "recordings with", len(batch.samples), "samples in", round(time.time() - start, 2), "seconds.")
+
+    # Recordings taken out of the batch must be the same as the stored ones, or dedup and the caches break.
+    recordings = [gd for _, file_recordings in load_files([entry["path"] for entry in discover_files(folder)][:10]) for gd in file_recordings]
+    check = GestureBatch.from_recordings(recordings)
+    if any(check.gesture_data(i).fingerprint() != gd.fingerprint() for i, gd in enumerate(recordings)):
+        raise Exception("Recordings taken out of a batch do not keep their fingerprint.")
+    print("Checked the fingerprints of", len(recordings), "recordings taken out of a batch.")
+
+    start = time.time()
+    print("Mean reading per photodiode:", batch.samples.mean(axis=0).round(1).tolist())
+    for (gesture_type, hand), group in batch.group_by("gesture_type", "hand").items():
+        print(gesture_type, hand + ":", len(group), "recordings, mean of the darkest reading",
+              group.minimums().mean(axis=0).round(1).tolist())
+    print("Statistics took", round(time.time() - start, 3), "seconds.")
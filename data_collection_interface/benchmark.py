@@ -0,0 +1,227 @@
+# Benchmarks of the data path on a generated dataset.
+# A dataset of configurable size is generated and written to temporary folders, after which every
+# benchmark reports its throughput and peak memory. Results are compared against a stored
+# baseline, so speedups and regressions of the data path are measured instead of guessed.
+#
+# Usage: python benchmark.py [--candidates 5] [--gestures 10] [--repetitions 10] [--save-baseline]
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+import numpy as np
+from contextlib import redirect_stdout
+from collector import Collector
+from gesture_data import GestureData, read_pickle, remove_entry_at
+from formatting_data import FormatData, SelectionStrategy
+from persistence import PersistenceService
+
+BASELINE_PATH = "./benchmarks/baseline.json"
+REGRESSION_THRESHOLD = 0.2 # Fraction a result may be worse than the baseline before it is a regression.
+SAMPLE_RATE = 1000
+DURATION = 2
+
+
+# Serial-like connection that serves bytes from memory, used to benchmark decoding without a device.
+class MemoryConnection:
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+        self.closed = False
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.data) - self.position
+
+    def read(self, size: int) -> bytes:
+        result = self.data[self.position:self.position + size]
+        self.position += len(result)
+        return result
+
+
+def generate_samples(random: np.random.Generator, samples: int) -> np.ndarray:
+    return random.integers(300, 800, size=(samples, 3))
+
+
+# Generates candidates x gestures x repetitions recordings, kept in memory.
+def generate_dataset(candidates: int, gestures: int, repetitions: int, seed=0) -> list[GestureData]:
+    random = np.random.default_rng(seed)
+    recordings = []
+    for candidate in range(candidates):
+        for gesture in range(gestures):
+            for _ in range(repetitions):
+                gd = GestureData(resistance=100000, sample_rate=SAMPLE_RATE, duration=DURATION)
+                gd.set_metadata(candidate="c" + str(candidate), hand="right_hand",
+                                gesture_type="digits", target_gesture="#" + str(gesture))
+                gd.data = generate_samples(random, gd.samples).tolist()
+                gd.timestamp = time.time() + len(recordings) # Timestamps must be unique within a file.
+                recordings.append(gd)
+    return recordings
+
+
+# Every benchmark takes the generated recordings and a scratch folder,
+# prepares what it needs and returns a function to time together with the amount of items it handles.
+
+def bench_collect(recordings, folder):
+    random = np.random.default_rng(0)
+    count = len(recordings)
+    raw = generate_samples(random, count * int(SAMPLE_RATE * DURATION)).astype(np.uint16).tobytes()
+    def run():
+        collector = Collector("memory", connection=MemoryConnection(raw))
+        for _ in range(count):
+            GestureData(0, SAMPLE_RATE, DURATION).collect(collector)
+    return run, count
+
+def bench_save_to_file(recordings, folder):
+    def run():
+        for gd in recordings:
+            gd.save_to_file(folder)
+    return run, len(recordings)
+
+def bench_persistence(recordings, folder):
+    def run():
+        service = PersistenceService(folder)
+        for gd in recordings:
+            service.submit(gd)
+        service.close()
+    return run, len(recordings)
+
+def bench_read_pickle(recordings, folder):
+    bench_save_to_file(recordings, folder)[0]()
+    paths = sorted(set(gd.get_pickle_path(folder) for gd in recordings))
+    def run():
+        for path in paths:
+            read_pickle(path)
+    return run, len(recordings)
+
+def bench_remove_entry_at(recordings, folder):
+    bench_save_to_file(recordings, folder)[0]()
+    # Remove the first recording of every file.
+    first = {}
+    for gd in recordings:
+        first.setdefault(gd.get_pickle_path(folder), gd.timestamp)
+    def run():
+        for path, timestamp in first.items():
+            remove_entry_at(path, timestamp)
+    return run, len(first)
+
+def bench_compute_thresholds(recordings, folder):
+    formatter = FormatData.__new__(FormatData) # Skip the constructor, which runs the whole pipeline.
+    data = [np.array(gd.data) for gd in recordings]
+    def run():
+        for iteration in data:
+            formatter._compute_thresholds_from_data(iteration, SelectionStrategy.MEAN)
+    return run, len(recordings)
+
+def bench_convert_processed_files(recordings, folder):
+    # Lay out the recordings like the output of the processing pipeline.
+    formatter = FormatData.__new__(FormatData)
+    formatter.path_to_data = "./src/data_collection/data"
+    for gd in recordings:
+        directory = os.path.join(folder, "post_process", formatter.path_to_data, gd.target_gesture, gd.hand, "candidate_" + gd.candidate)
+        os.makedirs(directory, exist_ok=True)
+        np.savetxt(os.path.join(directory, "iteration_" + str(len(os.listdir(directory))) + ".txt"), np.array(gd.data) / 1000)
+    def run():
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            formatter.convert_processed_files()
+        finally:
+            os.chdir(cwd)
+    return run, len(recordings)
+
+BENCHMARKS = {
+    "collect": bench_collect,
+    "save_to_file": bench_save_to_file,
+    "persistence": bench_persistence,
+    "read_pickle": bench_read_pickle,
+    "remove_entry_at": bench_remove_entry_at,
+    "compute_thresholds": bench_compute_thresholds,
+    "convert_processed_files": bench_convert_processed_files,
+}
+
+
+# Runs a benchmark in a fresh scratch folder and returns the time it took and its peak memory.
+def run_once(benchmark, recordings, trace_memory=False) -> tuple[float, int, int]:
+    folder = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            run, items = benchmark(recordings, folder)
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - start
+            peak = 0
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    finally:
+        shutil.rmtree(folder)
+    return seconds, items, peak
+
+
+# Takes the best time of a few runs, memory is traced in a separate run as tracing slows it down.
+def run_benchmark(benchmark, recordings, repeat: int) -> dict:
+    seconds, items, _ = min(run_once(benchmark, recordings) for _ in range(repeat))
+    _, _, peak = run_once(benchmark, recordings, trace_memory=True)
+    return {"seconds": seconds, "items_per_second": items / seconds, "peak_memory": peak}
+
+
+# Compares results with the baseline, returns the names of the benchmarks that regressed.
+def compare(results: dict, baseline: dict, threshold=REGRESSION_THRESHOLD) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        speed = result["items_per_second"] / baseline[name]["items_per_second"]
+        memory = result["peak_memory"] / max(baseline[name]["peak_memory"], 1)
+        status = "ok"
+        if speed < 1 - threshold or memory > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        print("{:<26} {:>6.2f}x speed {:>6.2f}x memory  {}".format(name, speed, memory, status))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the data path on a generated dataset.")
+    parser.add_argument("--candidates", type=int, default=5)
+    parser.add_argument("--gestures", type=int, default=10)
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best time is used.")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="Only run these benchmarks.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    recordings = generate_dataset(args.candidates, args.gestures, args.repetitions)
+    print("Benchmarking on", len(recordings), "recordings of", int(SAMPLE_RATE * DURATION), "samples.")
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = run_benchmark(BENCHMARKS[name], recordings, args.repeat)
+        print("{:<26} {:>12.1f} items/s {:>10.1f} MiB peak".format(
+            name, results[name]["items_per_second"], results[name]["peak_memory"] / 2 ** 20))
+
+    size = {"candidates": args.candidates, "gestures": args.gestures, "repetitions": args.repetitions}
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump({"size": size, "results": results}, file, indent=4)
+        print("Saved baseline to '" + args.baseline + "'")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["size"] != size:
+            print("Warning: baseline was made on a dataset of a different size", baseline["size"])
+        print("\nCompared to baseline '" + args.baseline + "':")
+        if compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
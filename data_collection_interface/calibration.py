@@ -0,0 +1,108 @@
+# Cached calibration profiles.
+# Recalibrating makes the device search its resistor configurations, which takes a few seconds.
+# The resistance found is kept per device and setup together with the ambient readings it gave,
+# so the next session can apply it directly and only recalibrates when the lighting changed.
+
+import os
+import json
+import time
+import tempfile
+import threading
+import numpy as np
+
+PROFILES_PATH = "./calibration/profiles.json"
+DEFAULT_SETUP = "default"
+DRIFT_THRESHOLD = 0.15 # Relative change of the ambient readings after which the device is recalibrated.
+AMBIENT_DURATION = 0.1 # Seconds of readings used to measure the ambient light.
+AMBIENT_SAMPLE_RATE = 100 # Used when the sample rate of the device has not been set yet.
+
+
+class CalibrationProfiles:
+    """Calibration profiles by device and setup, stored in a json file.
+
+    A profile holds the resistance found by a recalibration and the mean ambient reading of every diode.
+    Collectors in different threads must share one instance per file, see shared_profiles.
+    """
+
+    def __init__(self, path=PROFILES_PATH):
+        self.path = path
+        self.profiles = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as file:
+                    self.profiles = json.load(file)
+            except ValueError:
+                # A broken file only costs a recalibration, it is replaced on the next save.
+                print("Warning: calibration profiles at '" + path + "' could not be read, recalibrating.")
+
+    def get(self, device: str, setup: str = DEFAULT_SETUP) -> dict:
+        return self.profiles.get(device, {}).get(setup)
+
+    def put(self, device: str, setup: str, resistance: int, ambient) -> None:
+        with self.lock:
+            self.profiles.setdefault(device, {})[setup] = {
+                "resistance": int(resistance),
+                "ambient": [float(reading) for reading in ambient],
+                "timestamp": time.time(),
+            }
+            self.save()
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first, so an interruption never leaves a half written file.
+        descriptor, temporary = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(self.profiles, file, indent=4)
+        os.replace(temporary, self.path)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+# Returns the profiles of a file, the same instance (and lock) for every caller.
+def shared_profiles(path=PROFILES_PATH) -> CalibrationProfiles:
+    with _shared_lock:
+        key = os.path.abspath(path)
+        if key not in _shared:
+            _shared[key] = CalibrationProfiles(path)
+        return _shared[key]
+
+
+# Mean reading of every diode over a short measurement, without a hand in front of the device.
+def measure_ambient(collector, duration=AMBIENT_DURATION) -> np.ndarray:
+    data = collector.measure(duration=duration, sample_rate=collector.sample_rate or AMBIENT_SAMPLE_RATE)
+    return np.mean(np.asarray(data.data, dtype=np.float64).reshape(-1, 3), axis=0)
+
+
+# Largest relative change of a diode compared to the ambient readings of a profile.
+def ambient_drift(ambient, reference) -> float:
+    reference = np.maximum(np.asarray(reference, dtype=np.float64), 1)
+    return float(np.max(np.abs(np.asarray(ambient) - reference) / reference))
+
+
+# Applies the cached profile of the device if the ambient light did not drift past the threshold.
+# Otherwise (or when forced) the device is recalibrated and the profile is updated.
+# Returns the resistance the device uses.
+def calibrate(collector, setup=DEFAULT_SETUP, profiles: CalibrationProfiles = None,
+              threshold=DRIFT_THRESHOLD, force=False) -> int:
+    if profiles is None:
+        profiles = shared_profiles()
+    device = collector.serial_port
+
+    profile = profiles.get(device, setup)
+    if profile is not None and not force:
+        collector.set_resistance(profile["resistance"])
+        drift = ambient_drift(measure_ambient(collector), profile["ambient"])
+        if drift <= threshold:
+            print("Using calibration profile '" + setup + "' of", device, "(ambient drifted " + str(round(drift * 100, 1)) + "%).")
+            return collector.resistance
+        print("Ambient light drifted " + str(round(drift * 100, 1)) + "% since the last calibration.")
+
+    collector.recalibrate()
+    profiles.put(device, setup, collector.resistance, measure_ambient(collector))
+    return collector.resistance
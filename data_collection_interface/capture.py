@@ -0,0 +1,214 @@
+# Capture and replay of the raw serial traffic of a collector.
+# A CaptureTap sits between the Collector and its connection and records every byte that is read and
+# written, with the time since the start of the capture. A ReplayTransport plays a capture back to a
+# Collector as if it were the device, either at the original pace or as fast as possible.
+#
+# File layout: MAGIC | records of RECORD (direction, seconds, length) followed by the bytes.
+
+import time
+import struct
+
+MAGIC = b"GCAP\x01"
+RECORD = struct.Struct("<cdI")
+READ = b"R"
+WRITE = b"W"
+
+
+class CaptureTap:
+    """Serial-like connection that forwards to another connection and records the traffic to a file."""
+
+    def __init__(self, connection, path: str):
+        self.connection = connection
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.start = time.perf_counter()
+
+    def record(self, direction: bytes, data: bytes) -> None:
+        if data:
+            self.file.write(RECORD.pack(direction, time.perf_counter() - self.start, len(data)))
+            self.file.write(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self.connection.read(size)
+        self.record(READ, data)
+        return data
+
+    def readline(self) -> bytes:
+        data = self.connection.readline()
+        self.record(READ, data)
+        return data
+
+    def write(self, data) -> None:
+        self.record(WRITE, bytes(data))
+        self.connection.write(data)
+
+    # Bytes that are thrown away were still sent by the device, so they are part of the capture.
+    def reset_input_buffer(self) -> None:
+        self.record(READ, self.connection.read(self.connection.in_waiting))
+        self.connection.reset_input_buffer()
+
+    @property
+    def timeout(self):
+        return self.connection.timeout
+
+    @timeout.setter
+    def timeout(self, timeout) -> None:
+        self.connection.timeout = timeout
+
+    def close(self) -> None:
+        self.connection.close()
+        self.file.close()
+
+    # Everything else (in_waiting, closed, ...) is taken from the connection.
+    def __getattr__(self, name: str):
+        return getattr(self.connection, name)
+
+
+# Yields (seconds, direction, data) for every record of a capture file.
+def read_capture(path: str):
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise Exception("'" + path + "' is not a capture file.")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            direction, seconds, length = RECORD.unpack(header)
+            yield seconds, direction, file.read(length)
+
+
+class ReplayTransport:
+    """Serial-like connection that plays back the bytes read in a capture, to pass to Collector(connection=...).
+
+    Bytes become available at the pace they were captured, divided by speed, or right away with speed=None.
+    The timing restarts at every write of the host, so bytes that were answers to a command never arrive
+    before the command is written. Writes are compared to the captured writes, mismatches are counted.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.events = list(read_capture(path))
+        self.speed = speed
+        self.timeout = None
+        self.closed = False
+        self.mismatches = 0 # Writes of the host that differ from the captured ones.
+        self._next = 0 # Index of the next event that has not been replayed.
+        self._buffer = bytearray() # Bytes that arrived but were not read yet.
+        self._anchor = (time.perf_counter(), 0.0) # Time and capture time at which the replay was last in step.
+
+    # Capture time that has been reached.
+    def _now(self) -> float:
+        if self.speed is None:
+            return float("inf")
+        wall, captured = self._anchor
+        return captured + (time.perf_counter() - wall) * self.speed
+
+    # Whether the capture waits for the host, or has ended.
+    def _waiting(self) -> bool:
+        return self._next >= len(self.events) or self.events[self._next][1] == WRITE
+
+    # Moves the captured reads that are due into the buffer.
+    def _release(self, until: float = None) -> None:
+        until = self._now() if until is None else until
+        while not self._waiting() and self.events[self._next][0] <= until:
+            self._buffer += self.events[self._next][2]
+            self._next += 1
+
+    # Waits until arrived() is true, the capture waits for the host or the timeout expired.
+    def _wait_for(self, arrived) -> None:
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        self._release()
+        while not arrived() and not self._waiting():
+            delay = (self.events[self._next][0] - self._now()) / self.speed
+            if deadline is not None and time.perf_counter() + delay > deadline:
+                time.sleep(max(deadline - time.perf_counter(), 0))
+                self._release()
+                return
+            time.sleep(max(delay, 0))
+            self._release()
+
+    def read(self, size: int = 1) -> bytes:
+        self._wait_for(lambda: len(self._buffer) >= size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self) -> bytes:
+        self._wait_for(lambda: b"\n" in self._buffer)
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    # Everything the device sent before the captured write arrives right away, the timing restarts at it.
+    def write(self, data) -> None:
+        data = bytes(data)
+        self._release(float("inf"))
+        expected = b""
+        while len(expected) < len(data) and self._next < len(self.events) and self.events[self._next][1] == WRITE:
+            seconds, _, captured = self.events[self._next]
+            expected += captured
+            self._anchor = (time.perf_counter(), seconds)
+            self._next += 1
+        if expected[:len(data)] != data:
+            self.mismatches += 1
+            print("[Replay] Wrote " + data.hex() + ", the capture has " + expected.hex())
+
+    @property
+    def in_waiting(self) -> int:
+        self._release()
+        return len(self._buffer)
+
+    def reset_input_buffer(self) -> None:
+        self._release()
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+# Amount of records, bytes and the duration of a capture.
+def summarise(path: str) -> dict:
+    summary = {"reads": 0, "writes": 0, "bytes_read": 0, "bytes_written": 0, "duration": 0.0}
+    for seconds, direction, data in read_capture(path):
+        if direction == READ:
+            summary["reads"] += 1
+            summary["bytes_read"] += len(data)
+        else:
+            summary["writes"] += 1
+            summary["bytes_written"] += len(data)
+        summary["duration"] = seconds
+    return summary
+
+
+# If running as script, summarise a capture, or capture measurements of an emulated device and replay them.
+if __name__ == "__main__":
+    import sys
+    import numpy as np
+    from emulator import DeviceEmulator
+    from collector import Collector
+
+    if len(sys.argv) > 1:
+        print(summarise(sys.argv[1]))
+        sys.exit()
+
+    path = "capture.gcap"
+    takes = [(1, 500), (1, 1000)] # (duration, sample rate) of every measurement.
+
+    def run(collector: Collector) -> list:
+        collector.set_resistance(100000)
+        data = [collector.measure(duration, sample_rate).data for duration, sample_rate in takes]
+        collector.close()
+        return data
+
+    with DeviceEmulator() as emulator:
+        start = time.perf_counter()
+        recorded = run(Collector(emulator.port, capture=path))
+        print("Captured", summarise(path), "in", round(time.perf_counter() - start, 2), "seconds.")
+
+    for speed in [1.0, None]:
+        replay = ReplayTransport(path, speed)
+        start = time.perf_counter()
+        replayed = run(Collector("replay", connection=replay))
+        print("Replayed at", "full speed" if speed is None else str(speed) + "x", "in", round(time.perf_counter() - start, 2),
+              "seconds, identical:", all(np.array_equal(a, b) for a, b in zip(recorded, replayed)),
+              "mismatched writes:", replay.mismatches)
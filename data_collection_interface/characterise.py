@@ -0,0 +1,137 @@
+#
+# characterise.py
+# Characterises which sample rates the device can actually reach.
+# Sweeps a grid of sample rates x baud rates x durations using the binary protocol of the Collector,
+# and measures the achieved rate, the jitter between samples, dropped samples and the host CPU load.
+# Replaces the old sample_rate.py, which only counted text lines of a free running device.
+#
+
+import csv
+import time
+import numpy as np
+from collector import Collector, MEASUREMENT_START
+from main import SAMPLE_RATES
+
+BAUD_RATES = [19200, 115200]
+DURATIONS = [1, 2] # Seconds.
+READ_TIMEOUT = 0.5 # Seconds without data before the device is considered to have stopped sending.
+RATE_TOLERANCE = 0.02 # Fraction the achieved rate may be below the requested rate to count as achievable.
+BITS_PER_BYTE = 10 # Start and stop bit included.
+
+COLUMNS = ["sample_rate", "baud_rate", "duration", "expected", "received", "dropped", "short_reads",
+           "achieved_rate", "jitter_ms", "max_gap_ms", "cpu_percent", "link_limit", "achievable"]
+
+
+# Runs a single measurement and records when every read completed.
+def characterise(collector: Collector, sample_rate: int, duration: float) -> dict:
+    data = collector.prepare_measurement(duration, sample_rate)
+    expected = data.samples
+
+    collector.write_bytes(MEASUREMENT_START, np.uint32(expected))
+    start = time.perf_counter()
+    cpu_start = time.thread_time() # Only the reading thread, not the emulator of --emulate.
+
+    arrivals = [] # Pairs of (time the read completed, samples it returned).
+    received = 0
+    short_reads = 0
+    while received < expected:
+        chunk = collector.read_samples(expected - received)
+        if len(chunk) == 0:
+            # The read timed out, the device stopped sending samples.
+            short_reads += 1
+            break
+        arrivals.append((time.perf_counter(), len(chunk)))
+        received += len(chunk)
+
+    elapsed = arrivals[-1][0] - start if arrivals else 0.0
+    cpu = time.thread_time() - cpu_start
+
+    # Spread the time between reads over the samples they returned to estimate the sample intervals.
+    times = np.array([start] + [arrival for arrival, _ in arrivals])
+    counts = np.array([count for _, count in arrivals])
+    intervals = np.repeat(np.diff(times) / np.maximum(counts, 1), counts) if arrivals else np.zeros(0)
+
+    if received == expected:
+        collector.readline() # Confirmation that the measurement is done.
+    else:
+        # Out of sync with the device, throw away what is left.
+        time.sleep(READ_TIMEOUT)
+        collector.reset_input_buffer()
+
+    return {
+        "expected": expected,
+        "received": received,
+        "dropped": expected - received,
+        "short_reads": short_reads,
+        "achieved_rate": received / elapsed if elapsed > 0 else 0.0,
+        "jitter_ms": float(np.std(intervals) * 1000) if len(intervals) else 0.0,
+        "max_gap_ms": float(np.max(np.diff(times)) * 1000) if arrivals else 0.0,
+        "cpu_percent": 100 * cpu / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def sweep(serial_port: str, sample_rates=SAMPLE_RATES, baud_rates=BAUD_RATES, durations=DURATIONS) -> list[dict]:
+    results = []
+    for baud_rate in baud_rates:
+        collector = Collector(serial_port, baud_rate)
+        collector.read_timeout = READ_TIMEOUT
+        for sample_rate in sample_rates:
+            for duration in durations:
+                result = {"sample_rate": sample_rate, "baud_rate": baud_rate, "duration": duration}
+                result.update(characterise(collector, sample_rate, duration))
+
+                # Highest sample rate the serial link could carry at this baud rate.
+                result["link_limit"] = baud_rate / BITS_PER_BYTE / 6
+                result["achievable"] = (result["dropped"] == 0 and sample_rate <= result["link_limit"] and
+                                        result["achieved_rate"] >= sample_rate * (1 - RATE_TOLERANCE))
+                results.append(result)
+        collector.close()
+    return results
+
+
+def print_table(results: list[dict]) -> None:
+    print("\n{:>6} {:>7} {:>4} {:>9} {:>8} {:>10} {:>9} {:>9} {:>6} {:>10}".format(
+        "Hz", "baud", "s", "received", "dropped", "achieved", "jitter", "max gap", "cpu", "achievable"))
+    for r in results:
+        print("{:>6} {:>7} {:>4} {:>9} {:>8} {:>10.1f} {:>7.2f}ms {:>7.1f}ms {:>5.0f}% {:>10}".format(
+            r["sample_rate"], r["baud_rate"], r["duration"], r["received"], r["dropped"], r["achieved_rate"],
+            r["jitter_ms"], r["max_gap_ms"], r["cpu_percent"], "yes" if r["achievable"] else "NO"))
+
+
+def write_csv(path: str, results: list[dict]) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+    print("Results written to '" + path + "'")
+
+
+if __name__ == "__main__":
+    import argparse
+    from util import auto_select_serial_port
+
+    parser = argparse.ArgumentParser(description="Characterise the achievable sample rates of the device.")
+    parser.add_argument("--port", default=None, help="Serial port of the device, selected automatically if omitted.")
+    parser.add_argument("--emulate", action="store_true", help="Characterise an emulated device instead.")
+    parser.add_argument("--sample-rates", type=int, nargs="+", default=SAMPLE_RATES)
+    parser.add_argument("--baud-rates", type=int, nargs="+", default=BAUD_RATES)
+    parser.add_argument("--durations", type=float, nargs="+", default=DURATIONS)
+    parser.add_argument("--csv", default=None, help="Also write the results to this CSV file.")
+    args = parser.parse_args()
+
+    emulator = None
+    port = args.port
+    if args.emulate:
+        from emulator import DeviceEmulator
+        emulator = DeviceEmulator().start()
+        port = emulator.port
+    elif port is None:
+        port = auto_select_serial_port()
+
+    results = sweep(port, args.sample_rates, args.baud_rates, args.durations)
+    print_table(results)
+    if args.csv:
+        write_csv(args.csv, results)
+
+    if emulator is not None:
+        emulator.stop()
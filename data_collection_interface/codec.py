@@ -0,0 +1,70 @@
+# Compact storage of the photodiode samples.
+# Samples are stored as uint16, which holds the 10 bit readings of the device, and can
+# optionally be compressed losslessly. The compressed codecs store the difference between
+# consecutive samples, with the low and high bytes split so the mostly constant high bytes
+# compress well. Encoding and decoding are vectorized over the whole recording.
+
+import zlib
+import lzma
+import numpy as np
+
+CODECS = [None, "delta-zlib", "delta-lzma"]
+COMPRESSORS = {
+    "delta-zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "delta-lzma": (lzma.compress, lzma.decompress),
+}
+
+
+# Returns the samples as stored: an (n, 3) uint16 array, or compressed bytes for a codec.
+def encode_samples(data, codec=None):
+    samples = np.asarray(data, dtype=np.uint16).reshape(-1, 3)
+    if codec is None:
+        return samples
+    if codec not in COMPRESSORS:
+        raise Exception("Invalid codec '" + str(codec) + "'")
+
+    # Differences wrap around in uint16, so the cumulative sum restores the samples exactly.
+    delta = np.diff(samples, axis=0, prepend=np.zeros((1, 3), dtype=np.uint16))
+    planes = np.ascontiguousarray(delta.T).view(np.uint8).reshape(-1, 2).T
+    return COMPRESSORS[codec][0](planes.tobytes())
+
+
+def decode_samples(stored, codec=None) -> np.ndarray:
+    if codec is None:
+        return np.asarray(stored)
+    if codec not in COMPRESSORS:
+        raise Exception("Invalid codec '" + str(codec) + "'")
+
+    planes = np.frombuffer(COMPRESSORS[codec][1](stored), dtype=np.uint8).reshape(2, -1)
+    delta = np.ascontiguousarray(planes.T).view(np.uint16).reshape(3, -1).T
+    return np.cumsum(delta, axis=0, dtype=np.uint16)
+
+
+# If running as script, rewrite a dataset with compact (and optionally compressed) samples.
+if __name__ == "__main__":
+    import os
+    import sys
+    import pickle
+    from gesture_data import COLLECTION_PATH, read_pickle
+    from loader import discover_files
+
+    codec = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != "none" else None
+    folder = sys.argv[2] if len(sys.argv) > 2 else COLLECTION_PATH
+    if codec not in CODECS:
+        print("Usage: python codec.py [none|" + "|".join(CODECS[1:]) + "] [dataset folder]")
+        sys.exit(1)
+
+    before = after = 0
+    for entry in discover_files(folder):
+        path = entry["path"]
+        recordings = read_pickle(path)
+        before += os.path.getsize(path)
+
+        # Write to a temporary file first, so an interruption never leaves a half written file.
+        with open(path + ".tmp", "wb") as file:
+            for gd in recordings:
+                pickle.dump(gd.to_dict(codec), file)
+        os.replace(path + ".tmp", path)
+        after += os.path.getsize(path)
+
+    print("Rewrote dataset at '" + folder + "' from", before, "to", after, "bytes.")
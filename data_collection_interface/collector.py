@@ -1,77 +1,322 @@
 import time
+import struct
 import numpy as np
+from contextlib import nullcontext
 from serial import Serial
 from util import auto_select_serial_port
 from gesture_data import GestureData
+from metrics import AcquisitionMetrics
+from framing import FrameDecoder, FRAME_SAMPLES, PROTOCOL_RAW, PROTOCOL_FRAMED
+from capture import CaptureTap
+import calibration
+import trigger
 
 # Command bytes to send to the device.
 MEASUREMENT_START = 0xAB
 RECALIBRATE = 0xAC
 SET_SAMPLE_RATE = 0xAD
+SET_PROTOCOL = 0xAE
+SET_RESISTANCE = 0xAF
+STREAM_START = 0xB0
+STREAM_STOP = 0xB1
+STREAM_END = b"Finished streaming command.\r\n" # Sent by the device after the last sample of a stream.
+ENVELOPE = 0xB2 # Followed by an id and a command, which is then acknowledged in binary.
+ID_COUNT = 0x80 # Ids stay below all command bytes, so firmware without envelopes never runs an id as a command.
+
+# Binary acknowledgement of a command in an envelope: marker, id, status and a value (see main.cpp).
+ACK = struct.Struct("<BBBI")
+ACK_MARKER = 0xA6
+ACK_OK = 0
+ACK_UNKNOWN = 1
 
 # Default values for measurement.
 STANDARD_SAMPLING_RATE = 100 # Note that sampling rate is prone to inaccuracy.
                              # Try to use a multiple of 100 for best results.
 STANDARD_DURATION = 1 # Seconds to listen.
+SAMPLE_SIZE = 6 # Bytes per sample, three uint16 readings.
+FRAME_TIMEOUT = 1 # Seconds without a frame before the rest of a framed measurement is considered lost.
+COMMAND_TIMEOUT = 10 # Seconds to wait for the reply to a command, recalibrating takes a few seconds.
 
 class Collector: 
     
     
-    def __init__(self, serial_port: str = auto_select_serial_port(), baud_rate: int = 19200):
-        print("Connecting to gesture device at serial port", serial_port, "at baud rate", baud_rate)
-        self.connection = Serial(serial_port, baud_rate)
+    # An already open serial-like connection can be passed to use instead of opening the port.
+    # Samples that are read are also published to the ring, if given, see shared_ring.py.
+    # All bytes read and written are recorded to a capture file, if a path is given, see capture.py.
+    def __init__(self, serial_port: str = auto_select_serial_port(), baud_rate: int = 19200, metrics: AcquisitionMetrics = None, connection=None,
+                 ring=None, capture: str = None):
+        self.serial_port = serial_port
+        self.metrics = metrics # Optional instrumentation of the hot path.
+        self.ring = ring
+        if connection is not None:
+            self.connection = connection
+        else:
+            print("Connecting to gesture device at serial port", serial_port, "at baud rate", baud_rate)
+            with self.timer("connect"):
+                self.connection = Serial(serial_port, baud_rate)
+        if capture is not None:
+            print("Capturing the serial traffic to", capture)
+            self.connection = CaptureTap(self.connection, capture)
         self.resistance = 0
+        self.sample_rate = None # Sample rate the device was last set to.
+        self._partial = b"" # Bytes of an incomplete sample, kept until the rest arrives.
+        self.framed = False # Whether the device sends its samples in checked frames, see framing.py.
+        self.read_timeout = None # Seconds to wait for samples, None waits until they arrive.
+        self.command_timeout = COMMAND_TIMEOUT
+        self.decoder = FrameDecoder(self.connection.read)
+        self.achieved_sample_rate = None # Sample rate reached in the last measurement.
+        self.tagged = False # Whether commands are sent in envelopes with an id, see set_tagged.
+        self._next_id = 0
+        self.pending = {} # Names of the commands by id that have not been acknowledged yet.
+        self.acknowledged = {} # Values of acknowledged commands by id that were not waited for yet.
 
 
     def measure(self, duration=STANDARD_DURATION, sample_rate=STANDARD_SAMPLING_RATE, log=False) -> GestureData:
+        data = self.prepare_measurement(duration, sample_rate)
+        return self.run_measurement(data, log=log)
+
+
+    # Configures the device for a measurement, without starting it yet.
+    # Returns the empty GestureData that run_measurement will fill.
+    def prepare_measurement(self, duration=STANDARD_DURATION, sample_rate=STANDARD_SAMPLING_RATE) -> GestureData:
         print("Starting measurement on device")
 
         if (self.resistance == 0):
-            print("Warning: resistance is not set. Recalibrating.")
-            self.recalibrate()
+            print("Warning: resistance is not set. Calibrating.")
+            self.calibrate()
         
-        # Set the samping rate.
-        self.set_sample_rate(sample_rate)
+        # Set the samping rate, the device keeps it while we stay connected.
+        # With tagged commands it is sent together with the start of the measurement instead.
+        if sample_rate != self.sample_rate and not self.tagged:
+            self.set_sample_rate(sample_rate)
 
         # How many samples we expect to get to fill the time.
         data = GestureData(resistance=self.resistance, 
                            sample_rate=sample_rate, 
                            duration=duration)
+        data.device = self.serial_port
+        return data
+
+
+    # Starts the measurement on the device and reads all the samples into the data.
+    def run_measurement(self, data: GestureData, log=False) -> GestureData:
         samples = data.samples
-        print("Sampling for", duration, "seconds at", sample_rate, "Hz. Expecting", samples, "samples.", "Resistance is", self.resistance, "Ohms.")
+        print("Sampling for", data.duration, "seconds at", data.sample_rate, "Hz. Expecting", samples, "samples.", "Resistance is", self.resistance, "Ohms.")
 
         # Send the start measurement command.
-        self.write_bytes(MEASUREMENT_START, np.uint32(samples))
+        if self.tagged:
+            start_id = self.start_tagged(data.sample_rate, samples)
+        else:
+            self.write_bytes(MEASUREMENT_START, np.uint32(samples))
 
         # Time we started the measurement.
         start = time.time()
 
         # Read all the data using the collector.
+        self.reset_framing()
         data.collect(self, log=log)
 
         diff = time.time() - start
+        self.achieved_sample_rate = samples / diff
 
-        print("Measurement took", diff, "seconds. (expected " + str(duration) + " seconds)")
-        print("Achieved sampling rate of", samples / diff, "Hz. (expected " + str(sample_rate) + " Hz)  ")
+        print("Measurement took", diff, "seconds. (expected " + str(data.duration) + " seconds)")
+        print("Achieved sampling rate of", self.achieved_sample_rate, "Hz. (expected " + str(data.sample_rate) + " Hz)  ")
+        if self.framed:
+            data.dropped_samples = self.dropped_samples
+            print("Received", self.decoder.frames, "frames,", self.decoder.corrupted, "corrupted,", self.dropped_frames,
+                  "dropped (" + str(self.dropped_samples) + " samples),", self.decoder.skipped, "bytes skipped.")
 
         # Confirm that the measurement is done.
-        self.readline(log=True)
+        if self.tagged:
+            self.wait_for(start_id)
+        else:
+            self.readline(log=True)
 
         return data
 
 
+    # Streams continuously and captures the first count gestures, with context before and after them.
+    # See trigger.py for the detection and its settings.
+    def capture(self, sample_rate=STANDARD_SAMPLING_RATE, count=1, **settings) -> list[GestureData]:
+        return trigger.capture(self, sample_rate, count, **settings)
+
+    # Starts a continuous measurement, samples can be read with read_samples until stop_stream.
+    def start_stream(self, sample_rate=STANDARD_SAMPLING_RATE) -> None:
+        if (self.resistance == 0):
+            print("Warning: resistance is not set. Calibrating.")
+            self.calibrate()
+        if sample_rate != self.sample_rate:
+            self.set_sample_rate(sample_rate)
+
+        print("Streaming at", sample_rate, "Hz.")
+        # Never in an envelope, stop_stream looks for the line of text that ends the stream.
+        self.write_bytes(STREAM_START)
+        self.reset_framing()
+
+    # Stops a continuous measurement and skips the samples that were still underway.
+    def stop_stream(self) -> None:
+        self.write_bytes(STREAM_STOP)
+
+        # Samples are binary, so look for the end of stream message in everything that arrives.
+        received = self._partial + bytes(self.decoder.buffer)
+        self._partial = b""
+        self.decoder.reset()
+        self.use_timeout(self.command_timeout)
+        while STREAM_END not in received:
+            data = self.connection.read(max(self.connection.in_waiting, 1))
+            if not data:
+                raise Exception("Device did not confirm the end of the stream.")
+            received = received[-len(STREAM_END):] + data
+        print("[Serial] '" + STREAM_END.decode("utf-8").strip() + "'")
+
+
+    # Sends the sample rate (if it changed) and the start of a measurement in a single write,
+    # returns the id of the start command, which is acknowledged after the last sample.
+    def start_tagged(self, sample_rate: int, samples: int) -> int:
+        messages = []
+        rate_id = None
+        if sample_rate != self.sample_rate:
+            print("Setting sample frequency to", sample_rate, "Hz.")
+            rate_id, message = self.envelope("SET_SAMPLE_RATE", SET_SAMPLE_RATE, np.uint16(sample_rate))
+            messages.append(message)
+        start_id, message = self.envelope("MEASUREMENT_START", MEASUREMENT_START, np.uint32(samples))
+        messages.append(message)
+
+        with self.command("MEASUREMENT_START"):
+            self.write(b"".join(messages))
+            if rate_id is not None:
+                # The device handles the commands in order, so the sample rate is acknowledged before the first sample.
+                self.wait_for(rate_id)
+                self.sample_rate = sample_rate
+                if self.ring is not None:
+                    self.ring.set_sample_rate(sample_rate)
+        return start_id
+
     def recalibrate(self) -> int:
         print("Recalibrating light sensitivty of device.")
-        self.write_bytes(RECALIBRATE) 
-        self.resistance = self.readint()
+        with self.command("RECALIBRATE"):
+            self.resistance = int(self.confirm(self.send("RECALIBRATE", RECALIBRATE)))
         print("Resistance set to", self.resistance, "Ohms.")
         return self.resistance
 
 
+    # Applies a known resistor configuration, the device uses the one closest to the given resistance.
+    def set_resistance(self, resistance: int) -> int:
+        print("Setting resistance to", resistance, "Ohms.")
+        with self.command("SET_RESISTANCE"):
+            self.resistance = int(self.confirm(self.send("SET_RESISTANCE", SET_RESISTANCE, np.uint32(resistance))))
+        return self.resistance
+
+    # Uses the cached calibration profile of this device and setup, unless the ambient light drifted.
+    # See calibration.py.
+    def calibrate(self, setup=calibration.DEFAULT_SETUP, profiles=None, force=False) -> int:
+        return calibration.calibrate(self, setup=setup, profiles=profiles, force=force)
+
+
     def set_sample_rate(self, frequency: int) -> None:
         print("Setting sample frequency to", frequency, "Hz.")
-        self.write_bytes(SET_SAMPLE_RATE, np.uint16(frequency))
-        self.readline(log=True)
+        with self.command("SET_SAMPLE_RATE"):
+            self.confirm(self.send("SET_SAMPLE_RATE", SET_SAMPLE_RATE, np.uint16(frequency)), log=True)
+        self.sample_rate = frequency
+        if self.ring is not None:
+            self.ring.set_sample_rate(frequency)
+
+    # Switches between the raw and framed sample stream of the device.
+    def set_framed(self, framed: bool) -> None:
+        print("Setting protocol to", "framed" if framed else "raw")
+        self.confirm(self.send("SET_PROTOCOL", SET_PROTOCOL, PROTOCOL_FRAMED if framed else PROTOCOL_RAW), log=True)
+        self.framed = framed
+        # Lost frames should not block the measurement forever.
+        self.read_timeout = FRAME_TIMEOUT if framed else None
+
+    # Switches to sending commands in envelopes with an id, which the device acknowledges in binary.
+    # Configuration and start of a measurement then go out in a single write (see start_tagged).
+    # The device needs no state for this, but its firmware must support envelopes: this is checked by
+    # sending the current protocol in an envelope, which changes nothing on the device.
+    def set_tagged(self, tagged: bool) -> None:
+        if tagged and not self.tagged:
+            command_id, message = self.envelope("SET_PROTOCOL", SET_PROTOCOL, PROTOCOL_FRAMED if self.framed else PROTOCOL_RAW)
+            self.write(message)
+            self.use_timeout(self.command_timeout)
+            marker = self.connection.read(1)
+            if marker != bytes([ACK_MARKER]):
+                # Older firmware answers the envelope and the id with unknown commands and runs the command itself.
+                self.pending.clear()
+                time.sleep(0.1)
+                self.reset_input_buffer()
+                raise Exception("The firmware of the device does not support tagged commands, update it first.")
+            self.read_ack(marker)
+            self.acknowledged.pop(command_id)
+        self.tagged = tagged
+
+    # Returns the id and the bytes of a command in an envelope, the id is waited for with wait_for.
+    def envelope(self, name: str, command: int, *args) -> tuple[int, bytes]:
+        command_id = self._next_id
+        self._next_id = (self._next_id + 1) % ID_COUNT
+        if command_id in self.pending:
+            raise Exception("Too many commands are waiting for an acknowledgement.")
+        self.pending[command_id] = name
+        return command_id, b"".join(map(self.to_bytes, (ENVELOPE, command_id, command) + args))
+
+    # Sends a command, in an envelope if tagged. Returns its id, or None if it is not tagged.
+    def send(self, name: str, command: int, *args):
+        if not self.tagged:
+            self.write_bytes(command, *args)
+            return None
+        command_id, message = self.envelope(name, command, *args)
+        self.write(message)
+        return command_id
+
+    # Waits for the confirmation of a command sent with send.
+    # Returns the acknowledged value of a tagged command, otherwise the line the device confirmed it with.
+    def confirm(self, command_id, log=False):
+        if command_id is None:
+            return self.readline(log=log)
+        return self.wait_for(command_id, log=log)
+
+    # Reads acknowledgements until the one of the given id arrived, returns its value.
+    # Acknowledgements of other commands are kept until they are waited for.
+    def wait_for(self, command_id: int, log=False) -> int:
+        while command_id not in self.acknowledged:
+            self.read_ack(log=log)
+        return self.acknowledged.pop(command_id)
+
+    # Reads a single acknowledgement and matches it to the command it belongs to.
+    # Bytes of it that were already read can be passed as start.
+    # When it fails, the commands that are waiting are given up, so their ids can be used again.
+    def read_ack(self, start: bytes = b"", log=False) -> None:
+        self.use_timeout(self.command_timeout)
+        raw = start + self.connection.read(ACK.size - len(start))
+        if len(raw) < ACK.size:
+            names = list(self.pending.values())
+            self.pending.clear()
+            raise Exception("Device did not acknowledge the commands " + str(names) + ".")
+        marker, command_id, status, value = ACK.unpack(raw)
+        if marker != ACK_MARKER or command_id not in self.pending:
+            self.pending.clear()
+            raise Exception("Expected an acknowledgement, received " + raw.hex() + ".")
+
+        name = self.pending.pop(command_id)
+        if status != ACK_OK:
+            raise Exception("Device did not know command " + name + " (id " + str(command_id) + ").")
+        if log:
+            print("[Serial] Acknowledged " + name + " (id " + str(command_id) + "): " + str(value))
+        self.acknowledged[command_id] = value
+
+    def reset_framing(self) -> None:
+        self.decoder.reset()
+        self._position = 0 # Samples of the current measurement returned so far.
+        self._last_sample = np.zeros((1, 3), dtype=np.uint16)
+        self.dropped_frames = 0
+        self.dropped_samples = 0
+
+    # Times a section under the given name, if metrics are being recorded.
+    def timer(self, name: str):
+        return self.metrics.timer(name) if self.metrics is not None else nullcontext()
+
+    # Times the round trip of a command, if metrics are being recorded.
+    def command(self, name: str):
+        return self.metrics.command(name) if self.metrics is not None else nullcontext()
 
     # Take all arguments and try to send them as bytes over the serial port.
     # Write all the bytes to the serial port.
@@ -109,13 +354,84 @@ class Collector:
         self.connection.write(data)
 
 
+    # Sets the timeout of the connection, which samples and replies to commands each have their own of.
+    # Only changed when it differs, as changing it reconfigures the serial port.
+    # Connections without a timeout (like the in-memory one of benchmark.py) are taken to have none.
+    def use_timeout(self, timeout) -> None:
+        if getattr(self.connection, "timeout", None) != timeout:
+            self.connection.timeout = timeout
+
     # Reads a single line from the serial port.
     def readline(self, log=False) -> str:
+        self.use_timeout(self.command_timeout)
         line = self.connection.readline().decode("utf-8")
+        if not line.endswith("\n"):
+            raise Exception("Device did not answer within " + str(self.command_timeout) + " seconds.")
         if log:
             print("[Serial] '" + line.strip() + "'")
         return line
     
+    # Reads up to count samples, returned as an (n, 3) uint16 array.
+    # Takes everything that is already buffered, or blocks until at least one sample arrived.
+    # When the connection has a timeout, fewer (or no) samples are returned if it expires.
+    def read_samples(self, count: int) -> np.ndarray:
+        self.use_timeout(self.read_timeout)
+        samples = self.read_frame_samples(count) if self.framed else self.read_raw_samples(count)
+        if self.ring is not None:
+            self.ring.publish(samples)
+        return samples
+
+    # Reads up to count samples from the bare stream of samples.
+    def read_raw_samples(self, count: int) -> np.ndarray:
+        in_waiting = self.connection.in_waiting
+        count = min(count, max((in_waiting + len(self._partial)) // SAMPLE_SIZE, 1))
+
+        start = time.perf_counter()
+        raw = self._partial + self.connection.read(count * SAMPLE_SIZE - len(self._partial))
+        read = time.perf_counter()
+
+        # A read that timed out can end halfway a sample, keep that part for the next read.
+        whole = len(raw) - len(raw) % SAMPLE_SIZE
+        self._partial = raw[whole:]
+        samples = np.frombuffer(raw[:whole], dtype=np.uint16).reshape(-1, 3)
+
+        if self.metrics is not None:
+            self.metrics.record_read(len(raw), read - start, in_waiting)
+            self.metrics.record_decode(time.perf_counter() - read)
+        return samples
+
+    # Reads the samples of the next frame, at most count.
+    # Samples of lost frames are filled in by repeating the last sample, so the recording keeps its timing.
+    def read_frame_samples(self, count: int) -> np.ndarray:
+        in_waiting = self.connection.in_waiting
+        start = time.perf_counter()
+        frame = self.decoder.read_frame()
+        read = time.perf_counter()
+
+        if frame is None:
+            # The stream timed out, the rest of the measurement is lost.
+            index, samples = self._position + count, np.zeros((0, 3), dtype=np.uint16)
+        else:
+            index, samples = frame
+
+        missing = min(index - self._position, count)
+        if missing > 0:
+            self.dropped_frames += -(-missing // FRAME_SAMPLES)
+            self.dropped_samples += missing
+            samples = np.concatenate([np.repeat(self._last_sample, missing, axis=0), samples])
+        elif missing < 0:
+            samples = samples[-missing:] # Samples we already have, the frame was sent twice.
+
+        samples = samples[:count]
+        if len(samples):
+            self._last_sample = samples[-1:]
+        self._position += len(samples)
+
+        if self.metrics is not None:
+            self.metrics.record_read(len(samples) * SAMPLE_SIZE, read - start, in_waiting)
+            self.metrics.record_decode(time.perf_counter() - read)
+        return samples
+
     def readuint16(self) -> np.uint16:
         number = self.connection.read(2)
         return np.frombuffer(number, dtype=np.uint16)[0]
@@ -131,8 +447,11 @@ class Collector:
     def close(self) -> None:
         self.connection.close()
 
+    # Throws away everything that was received, including bytes that were read but not returned yet.
     def reset_input_buffer(self) -> None:
         self.connection.reset_input_buffer()
+        self._partial = b""
+        self.reset_framing()
 
 
 
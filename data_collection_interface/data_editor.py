@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import pickle
 from PyQt5.QtCore import Qt
 import glob
+import os
+from gesture_data import fingerprint, read_pickle_dicts, stored_samples
+from pyramid import Pyramid, PyramidPlot
 
 
 class MyWindow(QMainWindow):
@@ -41,11 +44,15 @@ class MyWindow(QMainWindow):
 
     def display_gesture(self):
         # Display the graph of a gesture
-        index = self.sender().text()
-        plt.plot(self.unpickled[int(index)])
-        plt.xlabel('Time')
-        plt.ylabel('Photodiode Reading')
-        plt.title(f'Photodiode Reading for Candidate {self.candidate_no}')
+        index = int(self.sender().text())
+        # The pyramid of a gesture is only made the first time it is displayed, see pyramid.py
+        if index not in self.pyramids:
+            self.pyramids[index] = Pyramid(stored_samples(self.unpickled[index]))
+        fig, axes = plt.subplots(1)
+        PyramidPlot(axes, self.pyramids[index])
+        axes.set_xlabel('Time')
+        axes.set_ylabel('Photodiode Reading')
+        axes.set_title(f'Photodiode Reading for Candidate {self.candidate_no}')
         plt.show()
 
     def update_file(self):
@@ -64,9 +71,16 @@ class MyWindow(QMainWindow):
                 if checkbox.isChecked():
                     pickle.dump(data, file)
 
+        # Skip gestures that are already in the file to move to, so they are never stored twice
+        existing = set(map(fingerprint, read_pickle_dicts(self.path_move))) if os.path.exists(self.path_move) else set()
         with open(self.path_move, "ab") as file:
             for data, checkbox in zip(self.unpickled, self.checkboxes):
                 if not checkbox.isChecked():
+                    digest = fingerprint(data)
+                    if digest in existing:
+                        print("SKIPPED DUPLICATE: ", checkbox.text())
+                        continue
+                    existing.add(digest)
                     pickle.dump(data, file)
 
         print("MOVED TO: ", self.path_move)
@@ -96,6 +110,7 @@ class MyWindow(QMainWindow):
 
         with open(self.path, 'rb') as f:
             self.unpickled = []
+            self.pyramids = {}
             while True:
                 try:
                     self.unpickled.append(pickle.load(f))
@@ -0,0 +1,85 @@
+# Duplicate detection across dataset files.
+# Every recording is identified by its fingerprint (see gesture_data.fingerprint), which is read from
+# the file when it was stored with one and computed otherwise. Files are hashed in parallel, after
+# which duplicates can be removed, keeping the first copy in path order.
+
+import os
+import glob
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from gesture_data import COLLECTION_PATH, fingerprint, read_pickle_dicts
+
+FILES_PER_SHARD = 8 # Files hashed by a worker per task.
+
+
+# Runs in a worker process, returns the fingerprints of the objects in every file of a shard.
+def _hash_shard(paths: list[str]) -> list[list[str]]:
+    return [list(map(fingerprint, read_pickle_dicts(path))) for path in paths]
+
+
+# Fingerprints of all pickle files below a folder, as {path: [hash of every object]}.
+def hash_files(folder=COLLECTION_PATH, workers: int = None) -> dict:
+    paths = sorted(glob.glob(os.path.join(folder, "**", "*.pickle"), recursive=True))
+    shards = [paths[i:i + FILES_PER_SHARD] for i in range(0, len(paths), FILES_PER_SHARD)]
+    if not shards:
+        return {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        hashes = [file_hashes for results in executor.map(_hash_shard, shards) for file_hashes in results]
+    return dict(zip(paths, hashes))
+
+
+# Finds objects that are stored more than once, as {hash: [(path, index), ...]} in path order.
+def find_duplicates(hashes: dict) -> dict:
+    locations = {}
+    for path, file_hashes in hashes.items():
+        for index, digest in enumerate(file_hashes):
+            locations.setdefault(digest, []).append((path, index))
+    return {digest: found for digest, found in locations.items() if len(found) > 1}
+
+
+# Removes every copy but the first of the duplicates, rewriting only the affected files.
+# Returns the amount of objects that were removed.
+def remove_duplicates(duplicates: dict) -> int:
+    removals = {}
+    for found in duplicates.values():
+        for path, index in found[1:]:
+            removals.setdefault(path, set()).add(index)
+
+    for path, indices in removals.items():
+        objects = read_pickle_dicts(path)
+
+        # Write to a temporary file first, so an interruption never leaves a half written file.
+        with open(path + ".tmp", "wb") as file:
+            for index, obj in enumerate(objects):
+                if index not in indices:
+                    pickle.dump(obj, file)
+        os.replace(path + ".tmp", path)
+        print("Removed", len(indices), "duplicates from '" + path + "'")
+
+    return sum(len(indices) for indices in removals.values())
+
+
+# If running as script, report (and optionally remove) the duplicates in a folder.
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find duplicate recordings across dataset files.")
+    parser.add_argument("folder", nargs="?", default=COLLECTION_PATH)
+    parser.add_argument("--remove", action="store_true", help="Remove all but the first copy of every duplicate.")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    hashes = hash_files(args.folder, args.workers)
+    duplicates = find_duplicates(hashes)
+    print("Hashed", sum(map(len, hashes.values())), "recordings in", len(hashes), "files in",
+          round(time.time() - start, 2), "seconds.")
+
+    for digest, found in duplicates.items():
+        print(digest + ": " + ", ".join(path + " #" + str(index) for path, index in found))
+    print("Found", len(duplicates), "recordings with", sum(len(found) - 1 for found in duplicates.values()), "extra copies.")
+
+    if args.remove and duplicates:
+        print("Removed", remove_duplicates(duplicates), "duplicates.")
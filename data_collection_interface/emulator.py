@@ -0,0 +1,267 @@
+# Software emulation of the gesture device on a pseudo terminal.
+# The emulator speaks the same serial protocol as data_collector/src/main.cpp,
+# so a Collector can connect to it as if it were a real board.
+
+import os
+import pty
+import tty
+import time
+import select
+import threading
+import numpy as np
+
+from collector import MEASUREMENT_START, RECALIBRATE, SET_SAMPLE_RATE, SET_PROTOCOL, SET_RESISTANCE, STREAM_START, STREAM_STOP, \
+    ENVELOPE, ACK, ACK_MARKER, ACK_OK, ACK_UNKNOWN
+from framing import encode_frame, FRAME_SAMPLES, PROTOCOL_FRAMED
+
+# Default values for the emulated device.
+EMULATED_RESISTANCE = 100000  # Ohms, one of the values from the resistor power set.
+AMBIENT_READING = 600  # Photodiode reading without a hand in front of the device.
+GESTURE_DEPTH = 350  # How far the readings drop while a gesture is performed.
+NOISE_LEVEL = 4  # Standard deviation of the noise on the readings.
+WRITE_INTERVAL = 0.01  # Seconds between writes when emulating in real time.
+CALIBRATION_TIME = 1.5  # Seconds the firmware takes to search a resistor configuration.
+GESTURE_INTERVAL = 2.0  # Seconds between the gestures performed while streaming.
+
+# Resistances of the configurations of the device, all series combinations of its resistors.
+RESISTORS = [660000, 330000, 100000, 22000]
+CONFIGURATIONS = sorted(sum(r for bit, r in enumerate(RESISTORS) if mask & (1 << bit)) for mask in range(16))
+
+
+class DeviceEmulator:
+    """Emulates a gesture device on a pseudo terminal.
+
+    The slave side of the pty is exposed as `port`, which can be passed to a Collector.
+    With `realtime` enabled the samples are paced at the requested sample rate,
+    otherwise they are written as fast as the pty accepts them.
+    In the framed protocol, `error_rate` is the chance that a frame gets a byte flipped, lost or duplicated.
+    `resistance` is the configuration that calibrates to the normal ambient reading, change `light`
+    to emulate brighter or darker surroundings.
+    """
+
+    def __init__(self, resistance: int = EMULATED_RESISTANCE, realtime: bool = True, seed: int = None,
+                 error_rate: float = 0.0) -> None:
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.resistance = resistance
+        self.applied_resistance = resistance # Configuration that is currently used.
+        self.light = 1.0 # Light intensity relative to the one the device was calibrated for.
+        self.realtime = realtime
+        self.sample_rate = 100
+        self.framed = False
+        self.error_rate = error_rate
+        self.random = np.random.default_rng(seed)
+
+        self.commands = {
+            MEASUREMENT_START: self.measurement_command,
+            RECALIBRATE: self.recalibrate_command,
+            SET_SAMPLE_RATE: self.set_sample_rate_command,
+            SET_PROTOCOL: self.set_protocol_command,
+            SET_RESISTANCE: self.set_resistance_command,
+            STREAM_START: self.stream_command,
+            ENVELOPE: self.envelope_command,
+        }
+        self._command_id = None # Id of the command that is being handled, if it came in an envelope.
+
+        self._buffer = b""
+        self._running = False
+        self._thread = None
+
+    def start(self) -> "DeviceEmulator":
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="emulator " + self.port, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self) -> "DeviceEmulator":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    # Generates the photodiode readings of a single measurement.
+    # A gesture is emulated as a dip in the readings that passes the diodes one after another.
+    def generate_samples(self, samples: int) -> np.ndarray:
+        return self.readings(np.linspace(0, 1, samples, endpoint=False))
+
+    # Readings at the given times in seconds, with a gesture at 0.5 seconds of every interval.
+    def readings(self, t: np.ndarray, interval: float = 1.0) -> np.ndarray:
+        centers = np.array([0.4, 0.5, 0.6])
+        dip = np.exp(-(((t[:, None] % interval) - centers) ** 2) / 0.005)
+        # The readings scale with the light and the resistance, like the output of the OPT101.
+        scale = self.light * self.applied_resistance / self.resistance
+        readings = (AMBIENT_READING - GESTURE_DEPTH * dip) * scale
+        readings += self.random.normal(0, NOISE_LEVEL, readings.shape)
+        return np.clip(readings, 0, 1023).astype(np.uint16)
+
+    def measurement_command(self) -> None:
+        samples = int(np.frombuffer(self._read_exact(4), dtype=np.uint32)[0])
+        data = self.generate_samples(samples)
+
+        # Blocks of bytes to send, together with the amount of samples that must be measured before each block.
+        if self.framed:
+            blocks = [(min(i + FRAME_SAMPLES, samples), self.corrupt(encode_frame(i, data[i:i + FRAME_SAMPLES])))
+                      for i in range(0, samples, FRAME_SAMPLES)]
+        else:
+            blocks = [(i + 1, data[i].tobytes()) for i in range(samples)]
+        self.send_blocks(blocks)
+
+        self._confirm(samples, "Finished measuring command.")
+
+    # Streams readings with a gesture every GESTURE_INTERVAL seconds, until the stop command arrives.
+    def stream_command(self) -> None:
+        start = time.perf_counter()
+        sent = 0
+        while self._running and STREAM_STOP not in self._buffer:
+            measured = int((time.perf_counter() - start) * self.sample_rate) if self.realtime else sent + FRAME_SAMPLES
+            if measured > sent:
+                data = self.readings(np.arange(sent, measured) / self.sample_rate, GESTURE_INTERVAL)
+                if self.framed:
+                    self._write(b"".join(self.corrupt(encode_frame(sent + i, data[i:i + FRAME_SAMPLES]))
+                                         for i in range(0, len(data), FRAME_SAMPLES)))
+                else:
+                    self._write(data.tobytes())
+                sent = measured
+            self._fill(WRITE_INTERVAL)
+
+        # Everything up to the stop command is ignored, like the firmware does.
+        self._buffer = self._buffer[self._buffer.find(STREAM_STOP) + 1:]
+        self._confirm(0, "Finished streaming command.")
+
+    def send_blocks(self, blocks: list) -> None:
+        if not self.realtime:
+            self._write(b"".join(block for _, block in blocks))
+            return
+
+        # Write the blocks in small groups, each at the moment their samples would have been measured.
+        start = time.perf_counter()
+        sent = 0
+        while sent < len(blocks) and self._running:
+            measured = int((time.perf_counter() - start) * self.sample_rate) + 1
+            due = sent
+            while due < len(blocks) and blocks[due][0] <= measured:
+                due += 1
+            if due > sent:
+                self._write(b"".join(block for _, block in blocks[sent:due]))
+                sent = due
+            time.sleep(min(WRITE_INTERVAL, 1 / self.sample_rate))
+
+    # Emulates transmission errors by flipping, losing or duplicating a byte.
+    def corrupt(self, frame: bytes) -> bytes:
+        if self.random.random() >= self.error_rate:
+            return frame
+        position = int(self.random.integers(len(frame)))
+        error = self.random.integers(3)
+        if error == 0:
+            return frame[:position] + bytes([frame[position] ^ 0xFF]) + frame[position + 1:]
+        if error == 1:
+            return frame[:position] + frame[position + 1:]
+        return frame[:position + 1] + frame[position:]
+
+    # Uses the configuration that brings the ambient reading closest to normal again.
+    def recalibrate_command(self) -> None:
+        if self.realtime:
+            time.sleep(CALIBRATION_TIME)
+        self.applied_resistance = self.closest_configuration(self.resistance / self.light)
+        self._confirm(self.applied_resistance, str(self.applied_resistance))
+
+    def set_resistance_command(self) -> None:
+        resistance = int(np.frombuffer(self._read_exact(4), dtype=np.uint32)[0])
+        self.applied_resistance = self.closest_configuration(resistance)
+        self._confirm(self.applied_resistance, str(self.applied_resistance))
+
+    def closest_configuration(self, resistance: float) -> int:
+        return min(CONFIGURATIONS, key=lambda configuration: abs(configuration - resistance))
+
+    def set_sample_rate_command(self) -> None:
+        self.sample_rate = int(np.frombuffer(self._read_exact(2), dtype=np.uint16)[0])
+        self._confirm(self.sample_rate, "Sample rate set to: " + str(self.sample_rate) + " Hz")
+
+    def set_protocol_command(self) -> None:
+        self.framed = self._read_exact(1)[0] == PROTOCOL_FRAMED
+        self._confirm(int(self.framed), "Protocol set to: " + ("framed" if self.framed else "raw"))
+
+    # Handles a command with an id, which is acknowledged in binary.
+    def envelope_command(self) -> None:
+        self._command_id, command = self._read_exact(2)
+        function = self.commands.get(command) if command != ENVELOPE else None
+        if function is not None:
+            function()
+        else:
+            self._write(ACK.pack(ACK_MARKER, self._command_id, ACK_UNKNOWN, 0))
+        self._command_id = None
+
+    # Main loop of the emulator, waits for commands like the firmware does.
+    def _serve(self) -> None:
+        while self._running:
+            if not self._fill(0.05):
+                continue
+            while self._buffer:
+                command = self._read_exact(1)[0]
+                function = self.commands.get(command)
+                if function is not None:
+                    function()
+                else:
+                    self._println("Received unknown command from serial.")
+
+    # Reads whatever is available from the pty into the buffer.
+    # Returns whether new data was read within the timeout.
+    def _fill(self, timeout: float) -> bool:
+        readable, _, _ = select.select([self.master], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            self._buffer += os.read(self.master, 1024)
+        except OSError:
+            return False
+        return True
+
+    def _read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size and self._running:
+            self._fill(0.05)
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view and self._running:
+            _, writable, _ = select.select([], [self.master], [], 0.05)
+            if writable:
+                view = view[os.write(self.master, view):]
+
+    # Acknowledges the command with a value if it came in an envelope, otherwise with a line of text.
+    def _confirm(self, value: int, line: str) -> None:
+        if self._command_id is not None:
+            self._write(ACK.pack(ACK_MARKER, self._command_id, ACK_OK, value))
+        else:
+            self._println(line)
+
+    def _println(self, line: str) -> None:
+        self._write((line + "\r\n").encode("utf-8"))
+
+
+# If running as script, serve emulated devices until interrupted.
+if __name__ == "__main__":
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    emulators = [DeviceEmulator().start() for _ in range(count)]
+    for emulator in emulators:
+        print("Emulating gesture device at serial port", emulator.port)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for emulator in emulators:
+            emulator.stop()
@@ -1,7 +1,5 @@
 import os
-import pickle
-from gesture_data import GestureData
-import numpy as np
+from loader import read_recordings
 
 GESTURE = "digits/#1"
 HAND = "right_hand"
@@ -9,16 +7,9 @@ CANDIDATE = "A3"
 PATH_TO_FILE = os.getcwd() + f"/dataset/{GESTURE}/{HAND}/candidate_{CANDIDATE}.pickle"
 
 
+# Reads the recordings of a file, a corrupt or truncated file gives the recordings before the broken one.
 def openFile(path):
-    result = []
-    with open(path, "rb") as handle:
-        while True:
-            try:
-                b = pickle.load(handle)
-                gd = GestureData.load_from_dict(b)
-                result.append(gd)
-            except:
-                return result
+    return read_recordings(path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+# Exports the pickled dataset into a single training-ready array.
+# All recordings are resampled to one sample rate and padded or cropped to one length,
+# then written to a memory mappable (N, T, 3) .npy file next to a metadata table.
+# The export is only rebuilt when the parameters or one of the input files change.
+
+import os
+import csv
+import json
+import numpy as np
+from gesture_data import COLLECTION_PATH
+from loader import discover_files, load_files
+from trim import TrimIndex, trim
+from stages import Pipeline, MovingAverage
+from resample import resample, HALF_TAPS, KAISER_BETA
+
+EXPORT_PATH = "./exports"
+SAMPLES_FILE = "samples.npy"
+METADATA_FILE = "metadata.csv"
+MANIFEST_FILE = "manifest.json"
+
+PAD_MODES = ["edge", "zero"] # Repeat the last reading, or fill with zeros.
+ALIGNMENTS = ["start", "center", "end"] # Which part of the recording is kept when cropping.
+DTYPES = ["float32", "uint16"]
+
+METADATA_COLUMNS = ["path", "entry", "timestamp", "candidate", "hand", "gesture_type", "target_gesture",
+                    "resistance", "sample_rate", "duration", "samples", "start", "end", "label"]
+BLOCK_SIZE = 1024 # Recordings copied at once when finalising the export.
+
+
+# Pads or crops a batch of recordings of shape (n, length, 3) to the given length.
+def fit_length(data: np.ndarray, length: int, pad_mode="edge", align="start") -> np.ndarray:
+    current = data.shape[1]
+    if current > length:
+        offset = {"start": 0, "center": (current - length) // 2, "end": current - length}[align]
+        return data[:, offset:offset + length]
+
+    if current < length:
+        missing = length - current
+        before = {"start": 0, "center": missing // 2, "end": missing}[align]
+        widths = ((0, 0), (before, missing - before), (0, 0))
+        return np.pad(data, widths, mode="edge" if pad_mode == "edge" else "constant")
+
+    return data
+
+
+# Identifies the state of the input files, used to decide if the export is outdated.
+def fingerprint_files(paths: list[str]) -> list:
+    fingerprint = []
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def is_up_to_date(output: str, manifest: dict) -> bool:
+    try:
+        with open(os.path.join(output, MANIFEST_FILE)) as file:
+            stored = json.load(file)
+    except (OSError, ValueError):
+        return False
+    stored.pop("classes", None)
+    return stored == manifest
+
+
+def export_dataset(output=EXPORT_PATH, folder=COLLECTION_PATH, sample_rate=100, duration=1000,
+                   gesture_type=None, pad_mode="edge", align="start", dtype="float32", force=False,
+                   trim_margin=None, pipeline: Pipeline = None) -> str:
+    if pad_mode not in PAD_MODES:
+        raise Exception("Invalid pad mode '" + pad_mode + "'")
+    if align not in ALIGNMENTS:
+        raise Exception("Invalid alignment '" + align + "'")
+    if dtype not in DTYPES:
+        raise Exception("Invalid dtype '" + dtype + "'")
+
+    paths = [entry["path"] for entry in discover_files(folder, gesture_type=gesture_type)]
+    length = int(round(sample_rate * duration / 1000))
+    manifest = {
+        "sample_rate": sample_rate,
+        "duration": duration,
+        "length": length,
+        "gesture_type": gesture_type,
+        "pad_mode": pad_mode,
+        "align": align,
+        "dtype": dtype,
+        "trim_margin": trim_margin,
+        "pipeline": pipeline.describe() if pipeline is not None else None,
+        "resampler": {"half_taps": HALF_TAPS, "kaiser_beta": KAISER_BETA},
+        "inputs": fingerprint_files(paths),
+    }
+
+    if not force and is_up_to_date(output, manifest):
+        print("Export at '" + output + "' is up to date.")
+        return output
+
+    os.makedirs(output, exist_ok=True)
+    if os.path.exists(os.path.join(output, MANIFEST_FILE)):
+        os.remove(os.path.join(output, MANIFEST_FILE))
+    print("Exporting", len(paths), "files to '" + output + "' at", sample_rate, "Hz and", length, "samples per recording.")
+
+    # Write the recordings to a raw file first, as the total amount is only known at the end.
+    raw_path = os.path.join(output, SAMPLES_FILE + ".tmp")
+    metadata = []
+    index = TrimIndex() if trim_margin is not None else None
+    with open(raw_path, "wb") as raw:
+        for path, recordings in load_files(paths):
+            regions = [(0, len(gd.data)) for gd in recordings]
+            if index is not None:
+                # Only keep the active region of every recording, see trim.py.
+                regions = index.offsets(recordings)
+            data = [trim(np.asarray(gd.data), start, end, trim_margin or 0, gd.sample_rate)
+                    for gd, (start, end) in zip(recordings, regions)]
+
+            # Group the recordings with the same rate and length, so each group is resampled at once.
+            groups = {}
+            for entry, gd in enumerate(recordings):
+                groups.setdefault((gd.sample_rate, len(data[entry])), []).append(entry)
+
+            for (rate, _), entries in groups.items():
+                batch = np.stack([data[entry] for entry in entries])
+                if pipeline is not None:
+                    # Preprocess the whole group at once, see stages.py.
+                    batch = pipeline.apply(batch)
+                    rate = rate / pipeline.rate_factor()
+                # Polyphase resampling with an anti-aliasing filter, see resample.py.
+                batch = resample(batch, rate, sample_rate)
+                batch = fit_length(batch, length, pad_mode, align)
+                if dtype == "uint16":
+                    batch = np.clip(np.rint(batch), 0, np.iinfo(np.uint16).max)
+                raw.write(batch.astype(dtype).tobytes())
+
+                for entry in entries:
+                    gd = recordings[entry]
+                    metadata.append({
+                        "path": path, "entry": entry, "timestamp": gd.timestamp, "candidate": gd.candidate,
+                        "hand": gd.hand, "gesture_type": gd.gesture_type, "target_gesture": gd.target_gesture,
+                        "resistance": gd.resistance, "sample_rate": gd.sample_rate, "duration": gd.duration,
+                        "samples": len(gd.data), "start": regions[entry][0], "end": regions[entry][1],
+                    })
+
+    # Give every target gesture a label number.
+    classes = sorted(set(row["target_gesture"] for row in metadata))
+    for row in metadata:
+        row["label"] = classes.index(row["target_gesture"])
+
+    # Copy the raw samples into a .npy file that can be memory mapped.
+    raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=(len(metadata), length, 3)) if metadata else np.zeros((0, length, 3), dtype)
+    samples = np.lib.format.open_memmap(os.path.join(output, SAMPLES_FILE), mode="w+", dtype=dtype, shape=(len(metadata), length, 3))
+    for start in range(0, len(metadata), BLOCK_SIZE):
+        samples[start:start + BLOCK_SIZE] = raw[start:start + BLOCK_SIZE]
+    samples.flush()
+    del raw, samples
+    os.remove(raw_path)
+    if index is not None:
+        index.save()
+
+    with open(os.path.join(output, METADATA_FILE), "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=METADATA_COLUMNS)
+        writer.writeheader()
+        writer.writerows(metadata)
+
+    # The manifest is written last, so an interrupted export is never seen as up to date.
+    manifest["classes"] = classes
+    with open(os.path.join(output, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file)
+
+    print("Exported", len(metadata), "recordings.")
+    return output
+
+
+# Opens an export for training. The samples are memory mapped, so nothing is read until used.
+# Returns the samples, the metadata rows and the class names belonging to the labels.
+def load_export(output=EXPORT_PATH) -> tuple[np.ndarray, list[dict], list[str]]:
+    samples = np.load(os.path.join(output, SAMPLES_FILE), mmap_mode="r")
+    with open(os.path.join(output, METADATA_FILE), newline="") as file:
+        metadata = list(csv.DictReader(file))
+    with open(os.path.join(output, MANIFEST_FILE)) as file:
+        classes = json.load(file)["classes"]
+    return samples, metadata, classes
+
+
+# If running as script, export the dataset with the given settings.
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the dataset to a single training-ready array.")
+    parser.add_argument("--folder", default=COLLECTION_PATH, help="Root folder of the dataset.")
+    parser.add_argument("--output", default=EXPORT_PATH, help="Folder to write the export to.")
+    parser.add_argument("--gesture-type", default=None, help="Only export this gesture type.")
+    parser.add_argument("--sample-rate", type=int, default=100, help="Target sample rate in Hz.")
+    parser.add_argument("--duration", type=int, default=1000, help="Target duration in milliseconds.")
+    parser.add_argument("--pad-mode", choices=PAD_MODES, default="edge")
+    parser.add_argument("--align", choices=ALIGNMENTS, default="start")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the export is up to date.")
+    parser.add_argument("--moving-average", type=int, default=None, metavar="WINDOW",
+                        help="Smooth the recordings with a moving average over this many samples before resampling.")
+    parser.add_argument("--trim", type=int, default=None, metavar="MARGIN",
+                        help="Only export the active region of every recording, with a margin in milliseconds.")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(MovingAverage(args.moving_average)) if args.moving_average else None
+    export_dataset(args.output, args.folder, args.sample_rate, args.duration, args.gesture_type,
+                   args.pad_mode, args.align, args.dtype, args.force, args.trim, pipeline)
@@ -9,6 +9,8 @@ from statistics import mean
 from typing import Tuple
 import numpy as np
 import subprocess
+from gesture_data import fingerprint_samples
+from baselines import Baselines
 
 
 BOUNDARY_TOLERANCE = 0.05 # Controls the percentage from constant values that readings can deviate before being discarded
@@ -34,6 +36,7 @@ class FormatData():
     def __init__(self):
         self.base_paths = []
         self.path_to_data = "./src/data_collection/data"
+        self._baselines = None # Cached statistics of the control recordings, only loaded when needed.
         self.pass_through_pipeline()
         self.convert_processed_files()
 
@@ -97,10 +100,15 @@ class FormatData():
             pre_path = "/reformatted"
             filenames = os.listdir(path)
             data_to_pickle = []
+            seen = set()
 
-            # Get the data from the files
+            # Get the data from the files, skipping outputs that are identical to one we already have
             for filename in filenames:
                 data = np.loadtxt(path + "/" + filename)
+                digest = fingerprint_samples(data)
+                if digest in seen:
+                    continue
+                seen.add(digest)
                 data_to_pickle.append(data)
                 
                 # Check if data is all ones
@@ -186,11 +194,15 @@ class FormatData():
                         capture_output=True)
 
 
+    @property
+    def baselines(self) -> Baselines:
+        if self._baselines is None:
+            self._baselines = Baselines(self.path_to_data)
+        return self._baselines
+
     def get_baselines(self, candidate):
-        with open(f"{self.path_to_data}/control/{candidate}.pickle", 'rb') as f:
-            data = pickle.load(f)
-            medians = np.median(data, 0)
-        return medians
+        # Median of all control recordings of the candidate, see baselines.py
+        return self.baselines.median(candidate)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+# Framed version of the binary sample stream.
+# In the framed protocol the device sends its samples in blocks, each with sync bytes,
+# the index of its first sample, a sample count and a CRC, so lost or corrupted bytes
+# only cost the frame they are in instead of misaligning the rest of the recording.
+#
+# Frame layout (little endian):
+#   0xA5 0x5A | uint32 index | uint8 count | count x (3 x uint16) | uint16 CRC-16/CCITT-FALSE
+# The CRC covers the index, count and samples.
+
+import struct
+import binascii
+import numpy as np
+
+SYNC = b"\xa5\x5a"
+HEADER = struct.Struct("<IB") # Index of the first sample and amount of samples in the frame.
+CRC = struct.Struct("<H")
+FRAME_SAMPLES = 16 # Maximum samples per frame, the device sends full frames except for the last.
+SAMPLE_SIZE = 6
+
+PROTOCOL_RAW = 0
+PROTOCOL_FRAMED = 1
+
+
+def crc16(data: bytes) -> int:
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+# Encodes samples into a frame, as the device does.
+def encode_frame(index: int, samples: np.ndarray) -> bytes:
+    body = HEADER.pack(index, len(samples)) + np.asarray(samples, dtype=np.uint16).tobytes()
+    return SYNC + body + CRC.pack(crc16(body))
+
+
+class FrameDecoder:
+    """Reads frames from a stream, resynchronising on the next valid frame after an error.
+
+    read is called with the amount of bytes still needed and returns at most that many,
+    fewer if it timed out. Only the bytes needed for a frame are requested, so the stream
+    is left right after the last frame.
+    """
+
+    def __init__(self, read):
+        self.read = read
+        self.buffer = bytearray()
+        self.frames = 0 # Valid frames decoded.
+        self.corrupted = 0 # Frames rejected because of a bad CRC or count.
+        self.skipped = 0 # Bytes thrown away while looking for the next frame.
+
+    def reset(self) -> None:
+        self.buffer.clear()
+        self.frames = self.corrupted = self.skipped = 0
+
+    # Makes sure the buffer holds at least size bytes, returns False if the read timed out.
+    def _fill(self, size: int) -> bool:
+        while len(self.buffer) < size:
+            data = self.read(size - len(self.buffer))
+            if not data:
+                return False
+            self.buffer += data
+        return True
+
+    # Throws away bytes up to the next possible start of a frame.
+    def _skip(self) -> None:
+        position = self.buffer.find(SYNC, 1)
+        if position == -1:
+            # Keep a last byte that could be the start of the sync bytes.
+            position = len(self.buffer) - 1 if self.buffer.endswith(SYNC[:1]) else len(self.buffer)
+        self.skipped += position
+        del self.buffer[:position]
+
+    # Returns the next valid frame as (index, samples), or None if the stream timed out.
+    def read_frame(self):
+        while True:
+            if not self._fill(len(SYNC)):
+                return None
+            if not self.buffer.startswith(SYNC):
+                self._skip()
+                continue
+
+            if not self._fill(len(SYNC) + HEADER.size):
+                return None
+            index, count = HEADER.unpack_from(self.buffer, len(SYNC))
+            if count > FRAME_SAMPLES:
+                self.corrupted += 1
+                self._skip()
+                continue
+
+            end = len(SYNC) + HEADER.size + count * SAMPLE_SIZE
+            if not self._fill(end + CRC.size):
+                return None
+            if crc16(bytes(self.buffer[len(SYNC):end])) != CRC.unpack_from(self.buffer, end)[0]:
+                self.corrupted += 1
+                self._skip()
+                continue
+
+            samples = np.frombuffer(bytes(self.buffer[len(SYNC) + HEADER.size:end]), dtype=np.uint16).reshape(-1, 3)
+            del self.buffer[:end + CRC.size]
+            self.frames += 1
+            return index, samples
@@ -13,25 +13,41 @@ import numpy as np
 import matplotlib.pyplot as plotter
 import matplotlib.widgets as widgets
 import os
+import json
 import time
+import hashlib
+from codec import encode_samples, decode_samples
+from pyramid import pyramid_for, PyramidPlot
 
 COLLECTION_PATH = "./dataset"
+COMPRESSION = None # Codec used to store the samples, see codec.py.
+HASH_KEYS = ["timestamp", "candidate", "hand", "gesture_type", "target_gesture", "sample_rate"] # Metadata in the fingerprint.
 
 
 class GestureData:
 
+    # Recordings are kept in large numbers, so they store their attributes without a dictionary.
+    # Use a GestureBatch (see batch.py) for computations over many recordings.
+    __slots__ = ("resistance", "sample_rate", "duration", "samples", "candidate", "hand", "gesture_type",
+                 "target_gesture", "timestamp", "session", "device", "dropped_samples", "hash", "data")
+
     data: list
 
     # Create static method that sets a gesture from a dictionary.
     @staticmethod
     def load_from_dict(obj: dict):
+        # Decompress the samples if they were stored with a codec.
+        if "codec" in obj:
+            obj = dict(obj)
+            obj["data"] = decode_samples(obj["data"], obj.pop("codec"))
+
         gesture_data = GestureData(0, 0, 0)
         gesture_data.set(obj)
         return gesture_data
         
     # Sets values from a dictionary.
     def set(self, obj: dict):
-        valid_keys = ["resistance", "sample_rate", "duration", "samples", "data", "candidate", "hand", "gesture_type", "target_gesture", "timestamp"]
+        valid_keys = ["resistance", "sample_rate", "duration", "samples", "data", "candidate", "hand", "gesture_type", "target_gesture", "timestamp", "session", "device", "dropped_samples", "hash"]
         for key in obj:
             if key not in valid_keys:
                 raise Exception("Invalid key '" + key + "'")
@@ -45,6 +61,10 @@ class GestureData:
         self.samples = int(duration * sample_rate)
         self.set_metadata() # Just initialize the metadata values.
         self.timestamp = time.time()
+        self.session = None # Shared start time when recorded together with other devices.
+        self.device = None # Serial port of the device that recorded the data.
+        self.dropped_samples = 0 # Samples lost in transmission, filled in by repeating the previous sample.
+        self.hash = None # Fingerprint stored with the data, updated whenever it is saved.
         self.data = [] # Initialize the data list to an empty array.
 
     def set_metadata(self, candidate: str = "Unknown Canidate", hand: str = "unknown",
@@ -67,17 +87,20 @@ class GestureData:
 
     # Uses a collctor to read all the samples retrieved from the serial port.
     def collect(self, collector: Collector, log=False) -> None:
-        # Get all measurements samples from the serial port.
-        for i in range(self.samples):
-            # Read a line from the serial port.
-            # Get the binary result.
-            r0 = collector.readuint16()
-            r1 = collector.readuint16()
-            r2 = collector.readuint16()
-            self.add_sample(r0, r1, r2)
-
+        # Get all measurements samples from the serial port, in chunks of whatever is available.
+        while len(self.data) < self.samples:
+            chunk = collector.read_samples(self.samples - len(self.data))
             if log:
-                print("[Measurement " + str(i) + "] " + str(r0) + ", " + str(r1) + ", " + str(r2))
+                for i, (r0, r1, r2) in enumerate(chunk, len(self.data)):
+                    print("[Measurement " + str(i) + "] " + str(r0) + ", " + str(r1) + ", " + str(r2))
+            start = time.perf_counter()
+            self.data.extend(chunk.tolist())
+            if collector.metrics is not None:
+                collector.metrics.record_decode(time.perf_counter() - start) # Converting is part of decoding.
+
+    # Content fingerprint of the samples and key metadata, see fingerprint_samples.
+    def fingerprint(self) -> str:
+        return fingerprint_samples(np.asarray(self.data).reshape(-1, 3), {key: getattr(self, key) for key in HASH_KEYS})
 
     def get_directory_path(self, folder=COLLECTION_PATH) -> str:
         return os.path.join(folder, self.gesture_type, self.target_gesture, self.hand)
@@ -92,8 +115,9 @@ class GestureData:
         directory = self.get_directory_path(folder)
         return os.path.join(directory, "candidate_" + candidate + ".pickle")
 
-    def save_to_file(self, folder=COLLECTION_PATH, path=None) -> None:
-        # Create the directory if it does not exist.
+    # The dictionary that is stored in the pickle files.
+    # Samples are stored as uint16, compressed if a codec is given.
+    def to_dict(self, codec=COMPRESSION) -> dict:
         data_dict = {
             "timestamp": self.timestamp,
             "candidate": self.candidate,
@@ -104,8 +128,19 @@ class GestureData:
             "sample_rate": self.sample_rate,
             "duration": self.duration,
             "samples": self.samples,
-            "data": np.array(self.data)
+            "session": self.session,
+            "device": self.device,
+            "dropped_samples": self.dropped_samples,
+            "data": encode_samples(self.data, codec),
+            "hash": self.fingerprint()
         }
+        self.hash = data_dict["hash"]
+        if codec is not None:
+            data_dict["codec"] = codec
+        return data_dict
+
+    def save_to_file(self, folder=COLLECTION_PATH, path=None, codec=COMPRESSION) -> None:
+        data_dict = self.to_dict(codec)
 
         if path == None:
             path = self.get_pickle_path(folder)
@@ -128,8 +163,8 @@ class GestureData:
         fig, plt = plotter.subplots(1)
         fig.subplots_adjust(bottom=0.3)
 
-        # Plot the data.
-        plt.plot(self.data)
+        # Plot the data, drawing only about a point per pixel of the plot (see pyramid.py).
+        PyramidPlot(plt, pyramid_for(self.data, self.hash or self.fingerprint()))
 
         # Set the labels of the axes.
         plt.set_xlabel("Samples")
@@ -204,18 +239,54 @@ def create_directories(path: str) -> None:
         os.makedirs(path)
 
 def read_pickle(path: str) -> list[GestureData]:
+    return list(map(GestureData.load_from_dict, read_pickle_dicts(path)))
+
+# Reads the raw dictionaries stored in a pickle file, without creating GestureData objects.
+# With partial, a corrupt or truncated file gives the objects before the broken one instead of raising.
+def read_pickle_dicts(path: str, partial=False) -> list[dict]:
     # Read the pickle file.
     data = []
     with open(path, "rb") as file:
         # As many times as possible try to read a pickle object.
         try:
             while True: 
-                gd_dict = pickle.load(file)
-                data.append(GestureData.load_from_dict(gd_dict))
+                data.append(pickle.load(file))
         except EOFError:
             pass
+        except Exception as exception:
+            if not partial:
+                raise
+            print("Stopped reading '" + path + "' after " + str(len(data)) + " recordings:", exception)
     return data
 
+# Hash of samples and (optionally) metadata, the same content always gives the same hash.
+# Integer samples are hashed as uint16, so old int64 recordings match their compact copies.
+def fingerprint_samples(samples: np.ndarray, metadata: dict = None) -> str:
+    samples = np.asarray(samples)
+    if samples.dtype.kind in "iub":
+        samples = samples.astype(np.uint16)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(samples.shape).encode("utf-8"))
+    digest.update(np.ascontiguousarray(samples).tobytes())
+    if metadata is not None:
+        digest.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+# Fingerprint of an object as stored in a pickle file, a recording dictionary or a bare array of samples.
+# Uses the stored hash when there is one.
+def fingerprint(obj) -> str:
+    if not isinstance(obj, dict):
+        return fingerprint_samples(obj)
+    if obj.get("hash") is not None:
+        return obj["hash"]
+    return fingerprint_samples(stored_samples(obj), {key: obj.get(key) for key in HASH_KEYS})
+
+# Samples of an object as stored in a pickle file, as an (n, 3) array.
+def stored_samples(obj) -> np.ndarray:
+    if isinstance(obj, dict):
+        return np.asarray(decode_samples(obj["data"], obj.get("codec"))).reshape(-1, 3)
+    return np.asarray(obj).reshape(-1, 3)
+
 def write_pickle(path: str, data: list[GestureData]) -> None:
     for gd in data:
         gd.save_to_file(path=path) # Save all the gesture data to a file.
@@ -0,0 +1,103 @@
+# Parallel loading of the pickled dataset.
+# Files are discovered and filtered on their path first, so files that are not needed
+# are never opened. The remaining files are divided into shards that are unpickled
+# by a pool of worker processes and streamed back in order. A corrupt or truncated file
+# gives the recordings before the broken one, so it does not stop loading the dataset.
+
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
+from gesture_data import COLLECTION_PATH, GestureData, read_pickle_dicts
+
+FILES_PER_SHARD = 8 # Files unpickled by a worker per task.
+BATCH_SIZE = 256 # Recordings per batch yielded by load_dataset.
+
+
+# Formats a candidate name the same way GestureData does for its file names.
+def format_candidate(candidate: str) -> str:
+    return candidate.lower().replace(" ", "_")
+
+
+# Checks a path component against a filter, which is None (anything), a string or a list of strings.
+def matches(value: str, accepted) -> bool:
+    if accepted is None:
+        return True
+    if isinstance(accepted, str):
+        return value == accepted
+    return value in accepted
+
+
+# Lists the files of the dataset that match the filters, without opening them.
+# The dataset is stored as <folder>/<gesture_type>/<target_gesture>/<hand>/candidate_<candidate>.pickle.
+def discover_files(folder=COLLECTION_PATH, gesture_type=None, target_gesture=None,
+                   hand=None, candidate=None) -> list[dict]:
+    if candidate is not None:
+        candidate = format_candidate(candidate) if isinstance(candidate, str) else list(map(format_candidate, candidate))
+
+    files = []
+    for path in sorted(glob.glob(os.path.join(folder, "*", "*", "*", "candidate_*.pickle"))):
+        relative = os.path.relpath(path, folder).split(os.sep)
+        entry = {
+            "path": path,
+            "gesture_type": relative[0],
+            "target_gesture": relative[1],
+            "hand": relative[2],
+            "candidate": relative[3][len("candidate_"):-len(".pickle")],
+        }
+        if (matches(entry["gesture_type"], gesture_type) and matches(entry["target_gesture"], target_gesture)
+                and matches(entry["hand"], hand) and matches(entry["candidate"], candidate)):
+            files.append(entry)
+    return files
+
+
+# Reads the dictionaries stored in a file, up to the first broken one.
+def read_file(path: str) -> list[dict]:
+    return read_pickle_dicts(path, partial=True)
+
+
+# Reads the recordings stored in a file, up to the first broken one.
+def read_recordings(path: str) -> list[GestureData]:
+    return list(map(GestureData.load_from_dict, read_file(path)))
+
+
+# Runs in a worker process, unpickles all the files of a shard.
+def _load_shard(paths: list[str]) -> list[list[dict]]:
+    return [read_file(path) for path in paths]
+
+
+# Loads files in parallel and yields (path, recordings) for every file, in the order of the paths.
+def load_files(paths: list[str], workers: int = None, files_per_shard=FILES_PER_SHARD):
+    shards = [paths[i:i + files_per_shard] for i in range(0, len(paths), files_per_shard)]
+    if not shards:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard, results in zip(shards, executor.map(_load_shard, shards)):
+            for path, dicts in zip(shard, results):
+                yield path, list(map(GestureData.load_from_dict, dicts))
+
+
+# Loads the recordings of the dataset that match the filters and yields them in batches.
+# See discover_files for the filters, workers defaults to the amount of cores.
+def load_dataset(folder=COLLECTION_PATH, batch_size=BATCH_SIZE, workers: int = None, **filters):
+    paths = [entry["path"] for entry in discover_files(folder, **filters)]
+
+    batch = []
+    for _, recordings in load_files(paths, workers):
+        batch.extend(recordings)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+# If running as script, load the whole dataset and report how long it took.
+if __name__ == "__main__":
+    import sys
+    import time
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else COLLECTION_PATH
+    start = time.time()
+    total = sum(len(batch) for batch in load_dataset(folder))
+    print("Loaded", total, "recordings in", time.time() - start, "seconds using", os.cpu_count(), "cores.")
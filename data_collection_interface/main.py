@@ -14,6 +14,7 @@ from PyQt5.QtWidgets import (
 import sys
 from util import serial_ports, auto_select_serial_port
 from collector import Collector
+from metrics import AcquisitionMetrics, JsonLinesSink, format_summary
 import time
 
 try:
@@ -27,6 +28,8 @@ DATASET_FOLDER = "data/"
 
 START_DELAY = 500  # Delay before measurment starts in ms.
 
+METRICS_PATH = "metrics/acquisition.jsonl"  # Where the acquisition metrics are written to.
+
 # Whole gesture selection UI is created from these constants.
 GESTURE_TYPES = ["gestures", "digits", "letters"]
 GESTURES = {
@@ -88,6 +91,7 @@ class CollectionWindow(QMainWindow):
         self.candidate_identifier = DEFAULT_CANDIDATE
         self.chosen_hand = "right"
         self.resistance = None  # Has not been calibrated yet.
+        self.metrics = AcquisitionMetrics(JsonLinesSink(METRICS_PATH))
 
         # Set the default gesture types and the defaults related to them.
         self.gesture_type = DEFAULT_GESTURE_TYPE
@@ -98,15 +102,20 @@ class CollectionWindow(QMainWindow):
         # Set the default sample settings in the UI.
         self.set_default_sample_settings()
 
+    # Always searches a new configuration, and stores it as the calibration profile of the device.
     def recalibrate(self):
-        self.resistance = self.collector().recalibrate()
+        self.resistance = self.collector().calibrate(force=True)
 
     def collector(self):
-        return Collector(self.serial_port)
+        return Collector(self.serial_port, metrics=self.metrics)
 
     def measure(self, gesture, save=True):
         if self.resistance is None:
-            self.recalibrate()  # Only recalibrate if we haven't already.
+            # Only calibrate if we haven't already, reusing the profile of the device when the light did not change.
+            self.resistance = self.collector().calibrate()
+
+        # Only count what happens for this measurement in the metrics.
+        self.metrics.reset()
 
         # Beep to indicate the start of the measurement.
         if sound is not None:
@@ -146,8 +155,19 @@ class CollectionWindow(QMainWindow):
         )
 
         if save:
-            data.save_to_file()  # Save the data to a file.
-        data.plot()  # Plot the data.
+            with self.metrics.timer("save"):
+                data.save_to_file()  # Save the data to a file.
+        with self.metrics.timer("plot"):
+            data.plot()  # Plot the data.
+
+        # Report where the time of this measurement went.
+        summary = self.metrics.finish(
+            candidate=self.candidate_identifier,
+            gesture=gesture,
+            sample_rate=self.sample_rate,
+            samples=len(data.data),
+        )
+        self.metrics_label.setText(format_summary(summary))
 
     def initializeUI(self):
         self.setWindowTitle("Data Collection Interface")
@@ -174,6 +194,7 @@ class CollectionWindow(QMainWindow):
         self.create_sample_duration_dropdown()
         self.create_test_button()
         self.create_gesture_buttons()
+        self.create_metrics_panel()
 
     def create_dropdown(
         self, label: str, options: list, field: str, on_change=None
@@ -341,6 +362,14 @@ class CollectionWindow(QMainWindow):
         # Add to the general grid.
         self._general_grid.addWidget(test_button)
 
+    def create_metrics_panel(self):
+        self.metrics_label = QLabel("No measurement taken yet.")
+        self.metrics_label.setStyleSheet("font-family: monospace")
+
+        # Add to the general grid.
+        self._general_grid.addWidget(QLabel("Last measurement:"))
+        self._general_grid.addWidget(self.metrics_label)
+
     def data_button_clicked(self):
         if self.serial_port is None:
             msg = QMessageBox()
@@ -0,0 +1,164 @@
+# Instrumentation of the acquisition hot path.
+# The Collector reports every serial read, command round trip and timed section to an
+# AcquisitionMetrics object, which summarises a measurement and writes it to a sink.
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets in seconds, four per decade from 10 us up to 10 s.
+LATENCY_BUCKETS = [10 ** (exponent / 4) for exponent in range(-20, 5)]
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last count is for values above the last bucket.
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    # Estimates a percentile (0 to 100) as the upper bound of the bucket it falls in.
+    def percentile(self, percentage: float) -> float:
+        target = self.count * percentage / 100
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target and seen > 0:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": self.buckets,
+            "counts": self.counts,
+        }
+
+
+# Appends metric events as JSON objects, one per line.
+class JsonLinesSink:
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a")
+
+    def write(self, event: dict) -> None:
+        self.file.write(json.dumps(event) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class AcquisitionMetrics:
+
+    def __init__(self, sink: JsonLinesSink = None):
+        self.sink = sink
+        self.last_summary = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.start = time.perf_counter()
+        self.bytes_read = 0
+        self.read_latency = Histogram()
+        self.wait_time = 0.0
+        self.decode_time = 0.0
+        self.in_waiting_max = 0
+        self.in_waiting_total = 0
+        self.timings = {}
+        self.commands = {}
+
+    # Called for every read of samples from the serial port.
+    # latency is the time blocked in the read, in_waiting the buffered bytes before it.
+    def record_read(self, size: int, latency: float, in_waiting: int) -> None:
+        self.bytes_read += size
+        self.read_latency.observe(latency)
+        self.wait_time += latency
+        self.in_waiting_max = max(self.in_waiting_max, in_waiting)
+        self.in_waiting_total += in_waiting
+
+    # Called for decoding the bytes of a read into samples, and for adding the samples to the recording.
+    def record_decode(self, seconds: float) -> None:
+        self.decode_time += seconds
+
+    # Times a section of code, like saving or plotting, under the given name.
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    # Times the round trip of a command, from writing it until its response was read.
+    @contextmanager
+    def command(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency = time.perf_counter() - start
+            self.commands.setdefault(name, []).append(latency)
+            self.emit("command", command=name, latency=latency)
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        reads = self.read_latency.count
+        return {
+            "elapsed": elapsed,
+            "bytes": self.bytes_read,
+            "bytes_per_second": self.bytes_read / elapsed if elapsed > 0 else 0.0,
+            "reads": reads,
+            "read_latency": self.read_latency.to_dict(),
+            "wait_time": self.wait_time,
+            "decode_time": self.decode_time,
+            "in_waiting_max": self.in_waiting_max,
+            "in_waiting_mean": self.in_waiting_total / reads if reads else 0.0,
+            "timings": dict(self.timings),
+            "commands": {name: sum(latencies) / len(latencies) for name, latencies in self.commands.items()},
+        }
+
+    def emit(self, event: str, **fields) -> None:
+        if self.sink is not None:
+            self.sink.write({"event": event, "time": time.time(), **fields})
+
+    # Writes the summary of everything recorded since the last reset, and starts over.
+    def finish(self, event="measurement", **fields) -> dict:
+        self.last_summary = {**fields, **self.summary()}
+        self.emit(event, **self.last_summary)
+        self.reset()
+        return self.last_summary
+
+
+# Formats a summary as short lines of text, used by the metrics panel of the interface.
+def format_summary(summary: dict) -> str:
+    lines = [
+        "Throughput: {:.0f} B/s over {} reads".format(summary["bytes_per_second"], summary["reads"]),
+        "Read latency: p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(
+            summary["read_latency"]["p50"] * 1000, summary["read_latency"]["p99"] * 1000, summary["read_latency"]["max"] * 1000),
+        "Waiting {:.3f} s, decoding {:.3f} s".format(summary["wait_time"], summary["decode_time"]),
+        "Serial buffer: mean {:.0f} B, max {} B".format(summary["in_waiting_mean"], summary["in_waiting_max"]),
+    ]
+    for name, seconds in summary["timings"].items():
+        lines.append("{}: {:.3f} s".format(name.capitalize(), seconds))
+    for name, latency in summary["commands"].items():
+        lines.append("{} round trip: {:.1f} ms".format(name, latency * 1000))
+    return "\n".join(lines)
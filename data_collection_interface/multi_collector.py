@@ -0,0 +1,107 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collector import Collector, STANDARD_DURATION, STANDARD_SAMPLING_RATE
+from gesture_data import GestureData
+from calibration import shared_profiles, DEFAULT_SETUP
+
+BARRIER_TIMEOUT = 30 # Seconds a configured device waits for the others before the measurement is given up.
+
+
+class MultiCollector:
+    """Drives several gesture devices at the same time.
+
+    Every device is configured first, after which all of them are released together
+    so the measurements start within a small skew of each other.
+    All recordings of one measurement are tagged with the same session timestamp.
+    """
+
+    def __init__(self, serial_ports: list[str], baud_rate: int = 19200):
+        self.collectors = [Collector(port, baud_rate) for port in serial_ports]
+        self.report = [] # Per device statistics of the last measurement.
+
+    # Runs a function on every collector in its own thread and returns the results in order.
+    def _run_all(self, function) -> list:
+        with ThreadPoolExecutor(max_workers=len(self.collectors)) as executor:
+            return list(executor.map(function, self.collectors))
+
+    def recalibrate(self) -> list[int]:
+        return self._run_all(lambda collector: collector.recalibrate())
+
+    # Applies the cached calibration profile of every device, recalibrating those where the light changed.
+    def calibrate(self, setup=DEFAULT_SETUP) -> list[int]:
+        profiles = shared_profiles()
+        return self._run_all(lambda collector: collector.calibrate(setup, profiles))
+
+    def measure(self, duration=STANDARD_DURATION, sample_rate=STANDARD_SAMPLING_RATE, log=False) -> list[GestureData]:
+        barrier = threading.Barrier(len(self.collectors), timeout=BARRIER_TIMEOUT)
+        session = time.time()
+        start_times = {}
+        errors = [] # Errors of devices that could not be configured.
+
+        def measure_device(collector: Collector) -> GestureData:
+            try:
+                data = collector.prepare_measurement(duration, sample_rate)
+            except Exception as error:
+                # Release the devices that are waiting for this one.
+                errors.append(error)
+                barrier.abort()
+                raise
+            data.session = session
+
+            # Wait until every device is configured, then start them all at once.
+            barrier.wait()
+            start_times[collector.serial_port] = time.perf_counter()
+            return collector.run_measurement(data, log=log)
+
+        try:
+            results = self._run_all(measure_device)
+        except threading.BrokenBarrierError:
+            # Report why a device failed, rather than that the others stopped waiting for it.
+            if errors:
+                raise errors[0]
+            raise
+
+        # Report how well the devices were aligned and which rates they reached.
+        first_start = min(start_times.values())
+        self.report = [{
+            "device": collector.serial_port,
+            "samples": len(data.data),
+            "start_offset": start_times[collector.serial_port] - first_start,
+            "achieved_sample_rate": collector.achieved_sample_rate,
+        } for collector, data in zip(self.collectors, results)]
+
+        print("Session", session, "recorded on", len(results), "devices with a start skew of",
+              max(start_times.values()) - first_start, "seconds.")
+        for entry in self.report:
+            print("[" + entry["device"] + "] " + str(entry["samples"]) + " samples, started +" +
+                  str(entry["start_offset"]) + " s, achieved " + str(entry["achieved_sample_rate"]) + " Hz")
+
+        return results
+
+    def set_metadata(self, data: list[GestureData], **metadata) -> None:
+        for gesture_data in data:
+            gesture_data.set_metadata(**metadata)
+
+    def close(self) -> None:
+        for collector in self.collectors:
+            collector.close()
+
+
+# If running as script, record on the given ports, or on emulated devices if none are given.
+if __name__ == "__main__":
+    import sys
+    from emulator import DeviceEmulator
+
+    ports = sys.argv[1:]
+    emulators = []
+    if not ports:
+        emulators = [DeviceEmulator().start() for _ in range(3)]
+        ports = [emulator.port for emulator in emulators]
+
+    collector = MultiCollector(ports)
+    data = collector.measure(sample_rate=500, duration=2)
+    collector.close()
+
+    for emulator in emulators:
+        emulator.stop()
@@ -0,0 +1,199 @@
+# Write-behind persistence of recordings.
+# Recordings are put on a bounded queue and written by a background thread, which appends
+# everything that queued up for a file in one write and keeps recently used files open.
+# Files are fsynced on a fixed cadence and everything is flushed when the service is closed,
+# which also happens automatically when the interpreter exits normally. Recordings that could not be
+# written are kept and tried again on the next write to their file, flush and close.
+
+import os
+import time
+import queue
+import pickle
+import atexit
+import threading
+from gesture_data import COLLECTION_PATH, COMPRESSION, GestureData, create_directories
+
+QUEUE_SIZE = 64 # Recordings that can wait to be written before submit blocks.
+FSYNC_INTERVAL = 1.0 # Seconds between fsyncs of the written files.
+IDLE_TIMEOUT = 10.0 # Seconds after which a file that was not written to is closed.
+MAX_OPEN_FILES = 32
+
+# Markers put on the queue instead of a path, to flush or stop the writer.
+FLUSH = object()
+CLOSE = object()
+
+
+class PersistenceService:
+    """Saves recordings from a background thread.
+
+    Note that files are kept open while they are written to, so other code that rewrites a
+    dataset file (like remove_entry_at) should call flush(close_files=True) first.
+    """
+
+    def __init__(self, folder=COLLECTION_PATH, queue_size=QUEUE_SIZE, fsync_interval=FSYNC_INTERVAL, codec=COMPRESSION):
+        self.folder = folder
+        self.codec = codec # Codec used to store the samples, see codec.py.
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.files = {} # Open files by path, with the time they were last written to.
+        self.unsynced = set() # Paths written to since the last fsync.
+        self.last_fsync = time.monotonic()
+        self.written = 0
+        self.failed = {} # Recordings that could not be written by path, tried again later.
+        self.error = None # Last error of the writer outside of writing, like a failed fsync.
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._work, name="persistence", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Queues a recording to be appended to its file, blocks only when the queue is full.
+    def submit(self, data: GestureData, path: str = None) -> None:
+        if self.closed:
+            raise Exception("Persistence service is closed, cannot save data.")
+        if path is None:
+            path = data.get_pickle_path(self.folder)
+        self.queue.put((path, data))
+
+    # Blocks until everything submitted so far is written and fsynced.
+    # Raises if recordings could not be written, they are kept to be tried again.
+    def flush(self, close_files=False) -> None:
+        done = threading.Event()
+        self.queue.put((FLUSH, (done, close_files)))
+        done.wait()
+        self._check()
+
+    # Writes everything that is left and stops the writer thread.
+    # Raises if recordings could not be written, they are still available in failed.
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put((CLOSE, None))
+        self.thread.join()
+        atexit.unregister(self.close)
+        self._check()
+
+    # Amount of recordings that could not be written.
+    def unsaved(self) -> int:
+        return sum(map(len, self.failed.values()))
+
+    def _check(self) -> None:
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+        if self.failed:
+            raise Exception("Failed to save " + str(self.unsaved()) + " recordings to: " + ", ".join(self.failed))
+
+    def _work(self) -> None:
+        while True:
+            try:
+                items = [self.queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                items = []
+
+            # Take everything else that is waiting, so it can be written in one go per file.
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batches = {}
+            stop = False
+            flushes = []
+            for path, item in items:
+                if path is CLOSE:
+                    stop = True
+                elif path is FLUSH:
+                    flushes.append(item)
+                else:
+                    batches.setdefault(path, []).append(item)
+
+            # The writer has to keep running and answer every flush, or flush() and close() wait forever.
+            # Errors are kept and raised by the next flush() or close() instead.
+            try:
+                # Recordings that failed before are tried again before they are reported.
+                if stop or flushes:
+                    for path in self.failed:
+                        batches.setdefault(path, [])
+
+                for path, recordings in batches.items():
+                    self._write(path, self.failed.pop(path, []) + recordings)
+
+                if stop or flushes or time.monotonic() - self.last_fsync >= self.fsync_interval:
+                    self._fsync()
+            except Exception as exception:
+                self._fail(exception)
+
+            # Files are closed even when syncing failed, so none are left open when the service stops.
+            try:
+                self._close_files(stop or any(close for _, close in flushes), time.monotonic())
+            except Exception as exception:
+                self._fail(exception)
+
+            for done, _ in flushes:
+                done.set()
+            if stop:
+                return
+
+    def _fail(self, exception: Exception) -> None:
+        self.error = exception
+        print("Persistence writer failed:", exception)
+
+    def _write(self, path: str, recordings: list[GestureData]) -> None:
+        try:
+            data = b"".join(pickle.dumps(recording.to_dict(self.codec)) for recording in recordings)
+            file = self._open(path)
+            file.write(data)
+            file.flush()
+            self.files[path] = (file, time.monotonic())
+            self.unsynced.add(path)
+            self.written += len(recordings)
+        except Exception as exception:
+            self.failed[path] = recordings
+            print("Failed to save", len(recordings), "recordings to '" + path + "':", exception)
+
+    def _open(self, path: str):
+        if path in self.files:
+            return self.files[path][0]
+
+        # Make room by closing the file that was written to longest ago.
+        if len(self.files) >= MAX_OPEN_FILES:
+            oldest = min(self.files, key=lambda open_path: self.files[open_path][1])
+            self._close(oldest)
+
+        create_directories(path)
+        print("Saving gesture data to file at: " + str(path))
+        return open(path, "ab")
+
+    def _fsync(self) -> None:
+        try:
+            for path in self.unsynced:
+                if path in self.files:
+                    os.fsync(self.files[path][0].fileno())
+        finally:
+            self.unsynced.clear()
+            self.last_fsync = time.monotonic()
+
+    # Closes all files, or only those that have been idle for a while.
+    # Raises the last error after trying to close every file.
+    def _close_files(self, everything: bool, now: float) -> None:
+        error = None
+        for path in list(self.files):
+            if everything or now - self.files[path][1] >= IDLE_TIMEOUT:
+                try:
+                    self._close(path)
+                except Exception as exception:
+                    error = exception
+        if error is not None:
+            raise error
+
+    def _close(self, path: str) -> None:
+        file, _ = self.files.pop(path)
+        try:
+            if path in self.unsynced:
+                self.unsynced.discard(path)
+                os.fsync(file.fileno())
+        finally:
+            file.close()
@@ -0,0 +1,153 @@
+# Headless export of plots of the whole dataset, for reviewing it without clicking through every recording.
+# Every recording is rendered to a PNG named after its hash by a pool of worker processes with the Agg
+# backend, so plots of different recordings never overwrite each other and recordings of which the image
+# already exists are skipped. The images of every gesture are then tiled into contact sheets.
+#
+# Layout: <output>/<gesture_type>/<target_gesture>/<hand>/<candidate>_<hash>.png
+#         <output>/<gesture_type>/<target_gesture>/contact_sheet_<n>.png
+
+import os
+import json
+import time
+import numpy as np
+import matplotlib
+import matplotlib.image as image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from gesture_data import COLLECTION_PATH, GestureData, fingerprint
+from loader import discover_files, format_candidate, read_file
+from pyramid import Pyramid
+
+PLOTS_PATH = "./plots/export"
+FIGURE_SIZE = (6.4, 3.6) # Inches, at DPI dots per inch.
+DPI = 100
+HASH_LENGTH = 16 # Characters of the hash in the name of an image.
+SHEET_COLUMNS = 8
+SHEET_SIZE = 64 # Images per contact sheet.
+THUMBNAIL_STEP = 2 # Every so many pixels of an image are kept in a contact sheet.
+
+
+# Runs once in every worker process, before anything is rendered.
+def _init() -> None:
+    matplotlib.use("Agg")
+
+
+# Renders a recording to a PNG, drawing about a point per pixel (see pyramid.py).
+def render(gd: GestureData, path: str) -> None:
+    # A figure without pyplot is never shown and is freed as soon as it is saved.
+    figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.subplots()
+    figure.subplots_adjust(bottom=0.25)
+
+    data = np.asarray(gd.data).reshape(-1, 3)
+    x, y = Pyramid(data).view(0, len(data), int(FIGURE_SIZE[0] * DPI))
+    axes.plot(x, y, linewidth=0.8)
+    axes.set_xlim(0, max(len(data) - 1, 1))
+    axes.set_xlabel("Samples")
+    axes.set_ylabel("Photodiode reading")
+    axes.set_title(gd.target_gesture + " by " + gd.candidate + " (" + gd.hand + ")")
+    figure.text(0.02, 0.02, "Sampling Rate: " + str(gd.sample_rate) + "Hz   Time: " + str(gd.duration) +
+                "s   Resistance: " + str(gd.resistance / 1000) + "kOhm   " +
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(gd.timestamp)), fontsize=8)
+
+    # Written under another name first, so an interrupted export never leaves a broken image behind.
+    temporary = path + ".tmp.png"
+    figure.savefig(temporary)
+    os.replace(temporary, path)
+
+
+# Runs in a worker process, renders the recordings of a file of which there is no image yet.
+# Returns the paths of the images of all recordings in the file and how many were rendered.
+def _render_file(entry: dict, output: str, force: bool) -> tuple[list[str], int]:
+    directory = os.path.join(output, entry["gesture_type"], entry["target_gesture"], entry["hand"])
+    os.makedirs(directory, exist_ok=True)
+
+    images = []
+    rendered = 0
+    # A broken file only loses the recordings from the broken one on, the rest of the export goes on.
+    for obj in read_file(entry["path"]):
+        # The hash covers the samples and metadata, so an existing image is of exactly this recording.
+        name = format_candidate(entry["candidate"]) + "_" + fingerprint(obj)[:HASH_LENGTH] + ".png"
+        path = os.path.join(directory, name)
+        if force or not os.path.exists(path):
+            render(GestureData.load_from_dict(obj), path)
+            rendered += 1
+        images.append(path)
+    return images, rendered
+
+
+# Runs in a worker process, tiles the images of a gesture into contact sheets of SHEET_SIZE images.
+# Sheets are only made again when the images on them changed. Returns how many sheets were made.
+def _make_sheets(directory: str, images: list[str], force: bool) -> int:
+    made = 0
+    for number, start in enumerate(range(0, len(images), SHEET_SIZE), 1):
+        sheet_images = images[start:start + SHEET_SIZE]
+        path = os.path.join(directory, "contact_sheet_" + str(number) + ".png")
+        index_path = path[:-len(".png")] + ".json"
+        names = [os.path.relpath(image_path, directory) for image_path in sheet_images]
+        if not force and os.path.exists(path) and os.path.exists(index_path):
+            with open(index_path) as file:
+                if json.load(file) == names:
+                    continue
+
+        thumbnails = [image.imread(image_path)[::THUMBNAIL_STEP, ::THUMBNAIL_STEP] for image_path in sheet_images]
+        height, width, channels = thumbnails[0].shape
+        rows = -(-len(thumbnails) // SHEET_COLUMNS)
+        sheet = np.ones((rows * height, min(len(thumbnails), SHEET_COLUMNS) * width, channels), dtype=np.float32)
+        for index, thumbnail in enumerate(thumbnails):
+            row, column = divmod(index, SHEET_COLUMNS)
+            sheet[row * height:(row + 1) * height, column * width:(column + 1) * width] = thumbnail
+
+        image.imsave(path, sheet)
+        with open(index_path, "w") as file:
+            json.dump(names, file)
+        made += 1
+    return made
+
+
+# Renders every recording of the dataset that matches the filters (see loader.discover_files) and makes
+# contact sheets of every gesture. Existing images are kept unless force is given.
+def export_plots(output=PLOTS_PATH, folder=COLLECTION_PATH, workers: int = None, sheets=True, force=False, **filters) -> int:
+    entries = discover_files(folder, **filters)
+    print("Plotting the recordings of", len(entries), "files to '" + output + "'")
+
+    gestures = {}
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init) as executor:
+        for entry, (images, count) in zip(entries, executor.map(_render_file, entries, repeat(output), repeat(force))):
+            directory = os.path.join(output, entry["gesture_type"], entry["target_gesture"])
+            gestures.setdefault(directory, []).extend(images)
+            rendered += count
+        total = sum(map(len, gestures.values()))
+        print("Rendered", rendered, "of", total, "recordings, the others were up to date.")
+
+        if sheets:
+            directories = list(gestures)
+            made = sum(executor.map(_make_sheets, directories, [gestures[directory] for directory in directories], repeat(force)))
+            print("Made", made, "contact sheets of", len(directories), "gestures.")
+    return rendered
+
+
+# If running as script, export the plots of the dataset.
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render plots of the dataset and contact sheets per gesture.")
+    parser.add_argument("--output", default=PLOTS_PATH, help="Folder to write the images to.")
+    parser.add_argument("--folder", default=COLLECTION_PATH, help="Root folder of the dataset.")
+    parser.add_argument("--gesture-type", default=None)
+    parser.add_argument("--target-gesture", default=None)
+    parser.add_argument("--hand", default=None)
+    parser.add_argument("--candidate", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-sheets", action="store_true", help="Do not make contact sheets.")
+    parser.add_argument("--force", action="store_true", help="Render all recordings again.")
+    args = parser.parse_args()
+
+    start = time.time()
+    export_plots(args.output, args.folder, args.workers, not args.no_sheets, args.force, gesture_type=args.gesture_type,
+                 target_gesture=args.target_gesture, hand=args.hand, candidate=args.candidate)
+    print("Took", round(time.time() - start, 2), "seconds.")
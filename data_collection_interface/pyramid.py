@@ -0,0 +1,120 @@
+# Min/max pyramid of a recording, for plotting long recordings quickly.
+# Every level of the pyramid holds the minimum and maximum reading of buckets of samples, each level
+# FACTOR times coarser than the one below it. A view of the recording takes the finest level that has at
+# most a bucket per pixel and draws the minimum and maximum of every bucket, so the plot looks the same as
+# plotting all samples (no peak is ever left out) but draws at most two points per pixel, at any zoom level.
+
+from collections import OrderedDict
+import numpy as np
+
+FACTOR = 4 # Samples per bucket of a level, relative to the level below it.
+MIN_LEVEL_LENGTH = 256 # No coarser levels are made once a level has fewer buckets than this.
+CACHE_SIZE = 64 # Pyramids kept in memory by pyramid_for.
+
+
+class Pyramid:
+    """Min/max pyramid of data of shape (samples, channels), or of a single channel of shape (samples,)."""
+
+    def __init__(self, data, factor=FACTOR):
+        data = np.asarray(data)
+        # Without samples the channels can not be inferred, they are taken from the shape instead.
+        self.data = data.reshape(len(data), -1) if data.size else data.reshape(0, int(np.prod(data.shape[1:])))
+        self.factor = factor
+        self.levels = [] # (bucket size, minimums, maximums) from fine to coarse.
+
+        minimums = maximums = self.data
+        size = 1
+        while len(minimums) > MIN_LEVEL_LENGTH:
+            # Repeating the last bucket to fill the last group does not change its minimum or maximum.
+            missing = -len(minimums) % factor
+            minimums = np.pad(minimums, ((0, missing), (0, 0)), mode="edge").reshape(-1, factor, minimums.shape[1]).min(axis=1)
+            maximums = np.pad(maximums, ((0, missing), (0, 0)), mode="edge").reshape(-1, factor, maximums.shape[1]).max(axis=1)
+            size *= factor
+            self.levels.append((size, minimums, maximums))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    # Returns the x (sample index) and y (readings per channel) to draw samples start up to end with at most
+    # about `pixels` buckets, as the minimum and maximum of every bucket after each other.
+    def view(self, start: float, end: float, pixels: int) -> tuple[np.ndarray, np.ndarray]:
+        start = int(np.clip(np.floor(start), 0, len(self)))
+        end = int(np.clip(np.ceil(end), start, len(self)))
+        pixels = max(pixels, 1)
+        if end - start <= pixels or not self.levels:
+            return np.arange(start, end), self.data[start:end]
+
+        # The finest level with at most a bucket per pixel.
+        level = self.levels[-1]
+        for candidate in self.levels:
+            if candidate[0] * pixels >= end - start:
+                level = candidate
+                break
+
+        size, minimums, maximums = level
+        first, last = start // size, -(-end // size)
+        x = np.repeat(np.arange(first, last) * size + (size - 1) / 2, 2)
+        y = np.stack([minimums[first:last], maximums[first:last]], axis=1).reshape(-1, self.data.shape[1])
+        return x, y
+
+
+_cache = OrderedDict()
+
+
+# Returns the pyramid of data, made only once for every key (for example the hash of a recording).
+def pyramid_for(data, key=None) -> Pyramid:
+    if key is None:
+        return Pyramid(data)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    pyramid = _cache[key] = Pyramid(data)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return pyramid
+
+
+class PyramidPlot:
+    """Lines of a pyramid on matplotlib axes, redrawn from the pyramid whenever the axes are zoomed, panned or resized."""
+
+    def __init__(self, axes, pyramid: Pyramid, **line_settings):
+        self.axes = axes
+        self.pyramid = pyramid
+        x, y = pyramid.view(0, len(pyramid), self.pixels())
+        self.lines = axes.plot(x, y, **line_settings)
+        axes.set_xlim(0, max(len(pyramid) - 1, 1))
+
+        axes.callbacks.connect("xlim_changed", lambda _: self.update())
+        axes.figure.canvas.mpl_connect("resize_event", lambda _: self.update())
+
+    # Width of the axes in pixels.
+    def pixels(self) -> int:
+        return max(int(self.axes.get_window_extent().width), 1)
+
+    def update(self) -> None:
+        start, end = sorted(self.axes.get_xlim())
+        x, y = self.pyramid.view(start, end + 1, self.pixels())
+        for channel, line in enumerate(self.lines):
+            line.set_data(x, y[:, channel])
+        self.axes.figure.canvas.draw_idle()
+
+
+# If running as script, show an hour of emulated readings at 1500 Hz, which can be zoomed from the hour down to single samples.
+if __name__ == "__main__":
+    import time
+    import matplotlib.pyplot as plotter
+    from emulator import DeviceEmulator
+
+    samples = 3600 * 1500
+    start = time.perf_counter()
+    with DeviceEmulator() as emulator:
+        data = emulator.readings(np.arange(samples) / 1500, 2.0)
+    pyramid = Pyramid(data)
+    print("Made a pyramid of", samples, "samples with", len(pyramid.levels), "levels in",
+          round(time.perf_counter() - start, 2), "seconds.")
+
+    fig, axes = plotter.subplots(1)
+    PyramidPlot(axes, pyramid)
+    axes.set_xlabel("Samples")
+    axes.set_ylabel("Photodiode reading")
+    plotter.show()
@@ -0,0 +1,121 @@
+# Resampling of recordings between sample rates.
+# Recordings are resampled by a rational factor up / down with a Kaiser windowed sinc low-pass filter,
+# which removes what the lower of the two rates cannot represent. The filter is split into its
+# polyphase components once per rate pair and length, after which a whole batch of recordings is
+# resampled with one gather and sum. Resampled recordings can be cached by recording hash and rate.
+
+import os
+import numpy as np
+from fractions import Fraction
+from functools import lru_cache
+from gesture_data import GestureData
+
+CACHE_PATH = "./resampled"
+HALF_TAPS = 16 # Zero crossings of the sinc on each side of the center, at the lower rate.
+KAISER_BETA = 6.0 # Trades the steepness of the filter against its stopband attenuation.
+MAX_DENOMINATOR = 1000 # Limits the up and down factors for rates that are not whole numbers.
+
+
+# Returns the up and down factors to go from the source to the target rate.
+def rate_factors(source_rate: float, target_rate: float) -> tuple[int, int]:
+    ratio = (Fraction(target_rate) / Fraction(source_rate)).limit_denominator(MAX_DENOMINATOR)
+    return ratio.numerator, ratio.denominator
+
+
+# Indices of the input samples and their weights for every output sample, shapes (output, taps).
+# Inputs before the start or after the end of the recording repeat the edge sample.
+@lru_cache(maxsize=64)
+def filter_bank(up: int, down: int, length: int, output: int) -> tuple[np.ndarray, np.ndarray]:
+    factor = max(up, down)
+    half = HALF_TAPS * factor # Half the length of the filter at the upsampled rate.
+    taps = 2 * half // up + 2
+
+    # Position of every output sample at the upsampled rate, and the inputs that fall within the filter.
+    centers = np.arange(output) * down
+    first = -((half - centers) // up) # First input index k with k * up >= center - half.
+    indices = first[:, None] + np.arange(taps)
+    offsets = centers[:, None] - indices * up
+
+    inside = np.abs(offsets) <= half
+    weights = np.sinc(offsets / factor) * np.kaiser(2 * half + 1, KAISER_BETA)[np.clip(offsets + half, 0, 2 * half)]
+    weights = np.where(inside, weights, 0)
+    weights /= weights.sum(axis=1, keepdims=True) # Constant readings stay exactly the same.
+    return np.clip(indices, 0, length - 1), weights.astype(np.float32)
+
+
+# Resamples a batch of recordings of the same rate and length, with shape (n, length, 3).
+# Returns float32 recordings of the given length, by default the duration stays the same.
+def resample(data: np.ndarray, source_rate: float, target_rate: float, length: int = None) -> np.ndarray:
+    data = np.asarray(data, dtype=np.float32)
+    if length is None:
+        length = int(round(data.shape[1] * target_rate / source_rate))
+    up, down = rate_factors(source_rate, target_rate)
+    if up == down:
+        return np.pad(data, ((0, 0), (0, max(length - data.shape[1], 0)), (0, 0)), mode="edge")[:, :length]
+
+    indices, weights = filter_bank(up, down, data.shape[1], length)
+    return np.einsum("nokc,ok->noc", data[:, indices], weights)
+
+
+class ResampleCache:
+    """Resampled recordings stored as .npy files by target rate and recording hash."""
+
+    def __init__(self, folder=CACHE_PATH):
+        # The filter settings are part of the folder, so changing them never returns stale results.
+        self.folder = os.path.join(folder, "kaiser_" + str(HALF_TAPS) + "_" + str(KAISER_BETA))
+
+    def path(self, key: str, target_rate: float) -> str:
+        return os.path.join(self.folder, str(target_rate) + "hz", key + ".npy")
+
+    def get(self, key: str, target_rate: float) -> np.ndarray:
+        path = self.path(key, target_rate)
+        return np.load(path) if os.path.exists(path) else None
+
+    def put(self, key: str, target_rate: float, data: np.ndarray) -> None:
+        path = self.path(key, target_rate)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, data)
+
+
+# Resamples recordings of any rate and length to the target rate, returning one array per recording.
+# Recordings with the same rate and length are resampled together, cached results are reused.
+def resample_recordings(recordings: list[GestureData], target_rate: float, cache: ResampleCache = None) -> list[np.ndarray]:
+    results = [None] * len(recordings)
+    keys = [None] * len(recordings)
+    groups = {}
+    for index, recording in enumerate(recordings):
+        if cache is not None:
+            keys[index] = recording.hash or recording.fingerprint()
+            results[index] = cache.get(keys[index], target_rate)
+        if results[index] is None:
+            groups.setdefault((recording.sample_rate, len(recording.data)), []).append(index)
+
+    for (rate, _), indices in groups.items():
+        batch = resample(np.stack([np.asarray(recordings[index].data) for index in indices]), rate, target_rate)
+        for index, data in zip(indices, batch):
+            results[index] = data
+            if cache is not None:
+                cache.put(keys[index], target_rate, data)
+    return results
+
+
+# If running as script, resample the whole dataset to a rate and report the time it took.
+if __name__ == "__main__":
+    import time
+    import argparse
+    from loader import load_dataset
+    from gesture_data import COLLECTION_PATH
+
+    parser = argparse.ArgumentParser(description="Resample the dataset to one rate, filling the cache.")
+    parser.add_argument("--folder", default=COLLECTION_PATH, help="Root folder of the dataset.")
+    parser.add_argument("--rate", type=float, default=100, help="Target sample rate in Hz.")
+    parser.add_argument("--cache", default=CACHE_PATH, help="Folder of the cache.")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else ResampleCache(args.cache)
+    start = time.time()
+    total = 0
+    for batch in load_dataset(args.folder):
+        total += len(resample_recordings(batch, args.rate, cache))
+    print("Resampled", total, "recordings to", args.rate, "Hz in", round(time.time() - start, 2), "seconds.")
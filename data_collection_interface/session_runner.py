@@ -0,0 +1,187 @@
+# Scripted recording sessions.
+# Records a whole plan of takes (candidates x hands x gestures x repetitions) back to back on a
+# single connection. Every finished take is handed to a background pipeline that saves and plots
+# it, so the next take can start while the previous one is still being written.
+
+import matplotlib
+matplotlib.use("Agg") # Plots are rendered to files from a background thread.
+
+import sys
+import time
+import queue
+import threading
+import matplotlib.pyplot as plotter
+from collector import Collector
+from gesture_data import GestureData
+from persistence import PersistenceService
+from calibration import DEFAULT_SETUP
+from main import GESTURES, DEFAULTS_PER_GESTURE_TYPE
+
+try:
+    import winsound as sound
+except ImportError:
+    sound = None
+
+CUE_DELAY = 300 # Time between the cue and the start of a take in ms.
+PAUSE = 1000 # Time between takes in ms.
+PIPELINE_SIZE = 16 # Takes that can wait for the pipeline before recording blocks.
+
+
+# Creates the takes of a session, repetitions of a gesture are recorded one after another.
+def build_plan(candidates: list[str], gesture_type: str, gestures: list[str] = None,
+               hands: list[str] = ("right_hand",), repetitions: int = 1) -> list[dict]:
+    if gestures is None:
+        gestures = GESTURES[gesture_type]
+
+    plan = []
+    for candidate in candidates:
+        for hand in hands:
+            for gesture in gestures:
+                for repetition in range(repetitions):
+                    plan.append({
+                        "candidate": candidate,
+                        "hand": hand,
+                        "gesture_type": gesture_type,
+                        "target_gesture": gesture,
+                        "repetition": repetition,
+                    })
+    return plan
+
+
+# Saves and plots recordings in a background thread.
+# Saving is handed to a write-behind persistence service, the pipeline thread only plots.
+class RecordingPipeline:
+
+    def __init__(self, save=True, plot=True, size=PIPELINE_SIZE):
+        self.persistence = PersistenceService() if save else None
+        self.plot = plot
+        self.queue = queue.Queue(maxsize=size)
+        self.failed = 0
+        self.thread = threading.Thread(target=self._work, name="recording pipeline", daemon=True)
+        self.thread.start()
+
+    def submit(self, data: GestureData) -> None:
+        if self.persistence is not None:
+            self.persistence.submit(data)
+        if self.plot:
+            self.queue.put(data)
+
+    # Waits until every submitted recording is handled and stops the thread.
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        if self.persistence is not None:
+            try:
+                self.persistence.close()
+            except Exception as exception:
+                self.failed += self.persistence.unsaved()
+                print(exception)
+
+    def _work(self) -> None:
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            try:
+                data.plot(show=False)
+                plotter.close("all")
+            except Exception as exception:
+                self.failed += 1
+                print("Failed to plot recording of", data.target_gesture, "by", data.candidate + ":", exception)
+
+
+class SessionRunner:
+
+    def __init__(self, collector: Collector, plan: list[dict], sample_rate: int, duration: int,
+                 pipeline: RecordingPipeline = None, cue_delay=CUE_DELAY, pause=PAUSE, setup=DEFAULT_SETUP,
+                 triggered=False):
+        self.collector = collector
+        self.plan = plan
+        self.sample_rate = sample_rate
+        self.duration = duration # In milliseconds, like the interface.
+        self.pipeline = pipeline if pipeline is not None else RecordingPipeline()
+        self.cue_delay = cue_delay
+        self.pause = pause
+        self.setup = setup # Calibration profile to use, see calibration.py.
+        self.triggered = triggered # Capture takes when the gesture is detected instead of for a fixed duration.
+
+    # Tells the operator which gesture to perform, and when.
+    def cue(self, number: int, take: dict) -> None:
+        print("\n[Take {}/{}] {} with {}: '{}' (repetition {})".format(
+            number + 1, len(self.plan), take["candidate"], take["hand"], take["target_gesture"], take["repetition"] + 1))
+        if sound is not None:
+            sound.Beep(1000, 100)
+        else:
+            sys.stdout.write("\a") # Terminal bell.
+        time.sleep(self.cue_delay / 1000)
+        print(">>> GO")
+
+    def run(self) -> None:
+        if self.collector.resistance == 0:
+            self.collector.calibrate(self.setup) # Only once for the whole session.
+
+        start = time.time()
+        for number, take in enumerate(self.plan):
+            self.cue(number, take)
+            if self.triggered:
+                data = self.collector.capture(sample_rate=self.sample_rate, max_duration=self.duration)[0]
+            else:
+                data = self.collector.measure(duration=self.duration / 1000, sample_rate=self.sample_rate)
+            data.set_metadata(candidate=take["candidate"], hand=take["hand"],
+                              gesture_type=take["gesture_type"], target_gesture=take["target_gesture"])
+            self.pipeline.submit(data)
+
+            if number + 1 < len(self.plan):
+                time.sleep(self.pause / 1000)
+
+        recorded = time.time() - start
+        self.pipeline.close()
+        print("\nRecorded", len(self.plan), "takes in", round(recorded, 1), "seconds,",
+              round(len(self.plan) / recorded * 3600), "recordings per hour.")
+        if self.pipeline.failed:
+            print("Warning:", self.pipeline.failed, "recordings could not be saved or plotted.")
+
+
+# If running as script, record a session with the given plan.
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record a scripted session of takes.")
+    parser.add_argument("--candidates", nargs="+", required=True)
+    parser.add_argument("--gesture-type", choices=list(GESTURES), default="gestures")
+    parser.add_argument("--gestures", nargs="+", default=None, help="Defaults to all gestures of the type.")
+    parser.add_argument("--hands", nargs="+", choices=["right_hand", "left_hand"], default=["right_hand"])
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--sample-rate", type=int, default=None, help="Defaults to the rate of the gesture type.")
+    parser.add_argument("--duration", type=int, default=None, help="In ms, defaults to that of the gesture type.")
+    parser.add_argument("--pause", type=int, default=PAUSE, help="Time between takes in ms.")
+    parser.add_argument("--trigger", action="store_true",
+                        help="Record a take when the gesture is detected, with --duration as the maximum.")
+    parser.add_argument("--port", default=None)
+    parser.add_argument("--setup", default=DEFAULT_SETUP, help="Name of the calibration profile of the device.")
+    parser.add_argument("--emulate", action="store_true", help="Record on an emulated device.")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args()
+
+    defaults = DEFAULTS_PER_GESTURE_TYPE[args.gesture_type]
+    plan = build_plan(args.candidates, args.gesture_type, args.gestures, args.hands, args.repetitions)
+
+    emulator = None
+    port = args.port
+    if args.emulate:
+        from emulator import DeviceEmulator
+        emulator = DeviceEmulator().start()
+        port = emulator.port
+
+    collector = Collector(port) if port is not None else Collector()
+    runner = SessionRunner(collector, plan,
+                           sample_rate=args.sample_rate or defaults["sample_rate"],
+                           duration=args.duration or defaults["sample_duration"],
+                           pipeline=RecordingPipeline(save=not args.no_save, plot=not args.no_plot),
+                           pause=args.pause, setup=args.setup, triggered=args.trigger)
+    runner.run()
+    collector.close()
+
+    if emulator is not None:
+        emulator.stop()
@@ -0,0 +1,180 @@
+# Ring buffer of samples in shared memory.
+# The collector publishes every sample it reads into the ring, from which consumers in other
+# processes read (n, 3) uint16 views without any pickling or copying. There is a single writer
+# and no lock: the header holds the amount of samples written, which the writer only increases
+# after the samples themselves are in place, so readers never see samples that are not written yet.
+# Readers that fall more than the capacity behind skip the samples that were overwritten.
+#
+# Layout: header (HEADER_SIZE bytes) | capacity x (3 x uint16)
+
+import time
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+HEADER = np.dtype([
+    ("written", "<u8"), # Samples written since the ring was created.
+    ("sequence", "<u8"), # Increased after every publish, readers can wait for it to change.
+    ("sample_rate", "<u4"), # Sample rate of the samples that are being published.
+    ("capacity", "<u4"), # Samples that fit in the ring.
+])
+HEADER_SIZE = 64
+SAMPLE_SIZE = 6
+CAPACITY = 1 << 16 # About 43 seconds at 1500 Hz.
+POLL_INTERVAL = 0.001 # Seconds between checks while waiting for new samples.
+
+_attach_lock = threading.Lock() # Readers attaching at the same time would restore each other's patch of the tracker.
+
+
+class SampleRing:
+    """Shared memory ring of samples, created by the writer and attached to by readers by name."""
+
+    def __init__(self, name: str = None, capacity: int = CAPACITY, create=True):
+        if create:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + capacity * SAMPLE_SIZE)
+        else:
+            try:
+                # Only the writer should remove the memory when it is done.
+                self.memory = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # Before Python 3.13 attaching registers the memory with the resource tracker, which removes
+                # it when the reader exits. Unregistering afterwards is no option, processes started by the
+                # writer share its tracker and would unregister the memory of the writer. So only the
+                # registration of this memory is skipped, everything else other threads register meanwhile
+                # is passed on, and a lock keeps readers from patching the tracker at the same time.
+                with _attach_lock:
+                    register = resource_tracker.register
+                    resource_tracker.register = lambda resource, rtype: (
+                        None if rtype == "shared_memory" and resource.lstrip("/") == name.lstrip("/") else register(resource, rtype))
+                    try:
+                        self.memory = shared_memory.SharedMemory(name=name)
+                    finally:
+                        resource_tracker.register = register
+        self.name = self.memory.name
+        self.owner = create
+
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.memory.buf)
+        if create:
+            self.header["written"] = 0
+            self.header["sequence"] = 0
+            self.header["sample_rate"] = 0
+            self.header["capacity"] = capacity
+        self.capacity = int(self.header["capacity"])
+        self.samples = np.ndarray((self.capacity, 3), dtype=np.uint16, buffer=self.memory.buf, offset=HEADER_SIZE)
+
+    @property
+    def written(self) -> int:
+        return int(self.header["written"])
+
+    @property
+    def sample_rate(self) -> int:
+        return int(self.header["sample_rate"])
+
+    def set_sample_rate(self, sample_rate: int) -> None:
+        self.header["sample_rate"] = sample_rate
+
+    # Writes samples into the ring, only the last capacity samples are kept.
+    def publish(self, samples: np.ndarray) -> None:
+        written = self.written
+        skipped = max(len(samples) - self.capacity, 0)
+        samples = samples[skipped:]
+        position = (written + skipped) % self.capacity
+        first = min(len(samples), self.capacity - position)
+        self.samples[position:position + first] = samples[:first]
+        self.samples[:len(samples) - first] = samples[first:]
+
+        # Only now the samples are in place, make them visible to the readers.
+        self.header["written"] = written + skipped + len(samples)
+        self.header["sequence"] += 1
+
+    # Releases the memory of this process, the views handed out must not be used anymore.
+    def close(self) -> None:
+        del self.header, self.samples
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass # Already removed by someone else.
+
+
+class SampleRingReader:
+    """Reads the samples published to a ring, possibly from another process.
+
+    Starts at the newest sample, or at the oldest one still in the ring with from_start.
+    """
+
+    def __init__(self, name: str, from_start=False):
+        self.ring = SampleRing(name, create=False)
+        written = self.ring.written
+        self.position = max(written - self.ring.capacity, 0) if from_start else written
+        self.lost = 0 # Samples that were overwritten before they were read.
+
+    # Returns the next samples as a view into the shared memory, at most max_samples.
+    # The view stays valid until the writer laps it, which can be checked with overwritten.
+    def read(self, max_samples: int = None) -> np.ndarray:
+        written = self.ring.written
+        oldest = written - self.ring.capacity
+        if self.position < oldest:
+            self.lost += oldest - self.position
+            self.position = oldest
+
+        start = self.position % self.ring.capacity
+        count = min(written - self.position, self.ring.capacity - start) # Up to the end of the ring.
+        if max_samples is not None:
+            count = min(count, max_samples)
+        self.position += count
+        return self.ring.samples[start:start + count]
+
+    # Whether the samples from a position on have been overwritten by now.
+    def overwritten(self, position: int) -> bool:
+        return position < self.ring.written - self.ring.capacity
+
+    # Waits until there are unread samples, returns False if none arrived within the timeout.
+    def wait(self, timeout: float = None) -> bool:
+        start = time.perf_counter()
+        while self.ring.written <= self.position:
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def close(self) -> None:
+        self.ring.close()
+
+
+# Runs in a separate process, consumes the ring and reports what it received.
+def _consume(name: str, duration: float) -> None:
+    reader = SampleRingReader(name)
+    received = 0
+    minimum = np.full(3, np.iinfo(np.uint16).max)
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        if reader.wait(0.1):
+            samples = reader.read()
+            received += len(samples)
+            minimum = np.minimum(minimum, samples.min(axis=0))
+    print("[Reader] Received", received, "samples at", reader.ring.sample_rate, "Hz, lost", reader.lost,
+          "- lowest readings", minimum.tolist())
+    reader.close()
+
+
+# If running as script, stream from an emulated device into a ring that another process reads.
+if __name__ == "__main__":
+    import multiprocessing
+    from emulator import DeviceEmulator
+    from collector import Collector
+
+    with DeviceEmulator() as emulator:
+        ring = SampleRing()
+        collector = Collector(emulator.port, ring=ring)
+        collector.resistance = emulator.resistance
+
+        reader = multiprocessing.Process(target=_consume, args=(ring.name, 4))
+        reader.start()
+        data = collector.measure(duration=3, sample_rate=1500)
+        reader.join()
+
+        print("[Collector] Measured", len(data.data), "samples, published", ring.written)
+        collector.close()
+        ring.close()
@@ -0,0 +1,167 @@
+# Preprocessing stages that work on chunks of a stream.
+# Every stage keeps the state it needs between chunks, so processing a recording chunk by chunk
+# gives exactly the same result as processing it at once. This way the same stages can be used
+# on live data (for example chunks read from a SampleRingReader) and on the stored dataset.
+#
+# Samples have time on the second to last axis and the photodiodes on the last axis, so a stage
+# handles a single chunk of shape (n, 3) as well as a batch of recordings of shape (recordings, n, 3).
+
+import numpy as np
+from abc import ABC, abstractmethod
+
+
+class Stage(ABC):
+
+    # Forgets the state, so the next chunk is treated as the start of a new stream.
+    def reset(self) -> None:
+        pass
+
+    @abstractmethod
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        pass
+
+    # Factor by which the stage lowers the sample rate.
+    def rate_factor(self) -> int:
+        return 1
+
+    # Settings of the stage, used to tell if stored results are outdated.
+    def describe(self) -> dict:
+        return {"stage": type(self).__name__}
+
+
+class MovingAverage(Stage):
+    """Causal moving average, the first samples are averaged over the samples there are so far."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self.history = None # Last window - 1 samples of the previous chunks.
+        self.seen = 0
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.shape[-2] == 0:
+            return chunk
+        if self.history is None:
+            shape = list(chunk.shape)
+            shape[-2] = self.window - 1
+            self.history = np.zeros(shape)
+
+        # Every window is summed in the same order, whatever the chunks are.
+        padded = np.concatenate([self.history, chunk], axis=-2)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.window, axis=-2)
+        counts = np.minimum(np.arange(self.seen + 1, self.seen + chunk.shape[-2] + 1), self.window)
+        result = windows.sum(axis=-1) / counts[:, None]
+
+        self.history = padded[..., padded.shape[-2] - (self.window - 1):, :]
+        self.seen += chunk.shape[-2]
+        return result
+
+    def describe(self) -> dict:
+        return {"stage": "MovingAverage", "window": self.window}
+
+
+class BaselineSubtraction(Stage):
+    """Subtracts the ambient reading of every photodiode, for example a median of baselines.py."""
+
+    def __init__(self, baseline):
+        self.baseline = np.asarray(baseline, dtype=np.float64)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        return np.asarray(chunk, dtype=np.float64) - self.baseline
+
+    def describe(self) -> dict:
+        return {"stage": "BaselineSubtraction", "baseline": self.baseline.tolist()}
+
+
+class Normalise(Stage):
+    """Divides the readings of every photodiode by its threshold, as computed by FormatData."""
+
+    def __init__(self, thresholds):
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        return np.asarray(chunk, dtype=np.float64) / self.thresholds
+
+    def describe(self) -> dict:
+        return {"stage": "Normalise", "thresholds": self.thresholds.tolist()}
+
+
+class Decimate(Stage):
+    """Keeps every factor-th sample of the stream, counting on over the chunks."""
+
+    def __init__(self, factor: int):
+        self.factor = factor
+        self.reset()
+
+    def reset(self) -> None:
+        self.offset = 0 # Index in the current chunk of the first sample to keep.
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        result = chunk[..., self.offset::self.factor, :]
+        self.offset = (self.offset - chunk.shape[-2]) % self.factor
+        return result
+
+    def rate_factor(self) -> int:
+        return self.factor
+
+    def describe(self) -> dict:
+        return {"stage": "Decimate", "factor": self.factor}
+
+
+class Pipeline(Stage):
+    """Stages that are applied one after another."""
+
+    def __init__(self, *stages: Stage):
+        self.stages = list(stages)
+
+    def reset(self) -> None:
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        for stage in self.stages:
+            chunk = stage.process(chunk)
+        return chunk
+
+    # Processes whole recordings (or a batch of recordings of the same length) at once.
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        self.reset()
+        result = self.process(data)
+        self.reset()
+        return result
+
+    def rate_factor(self) -> int:
+        return int(np.prod([stage.rate_factor() for stage in self.stages]))
+
+    def describe(self) -> dict:
+        return {"stage": "Pipeline", "stages": [stage.describe() for stage in self.stages]}
+
+
+# If running as script, process a stream from an emulated device live and compare it to processing it afterwards.
+if __name__ == "__main__":
+    import time
+    from emulator import DeviceEmulator
+    from collector import Collector
+
+    pipeline = Pipeline(MovingAverage(8), BaselineSubtraction([600, 600, 600]), Decimate(4))
+    with DeviceEmulator() as emulator:
+        collector = Collector(emulator.port)
+        collector.resistance = emulator.resistance
+        collector.start_stream(1500)
+
+        received, processed = [], []
+        start = time.perf_counter()
+        while time.perf_counter() - start < 2:
+            chunk = collector.read_samples(256)
+            received.append(chunk)
+            processed.append(pipeline.process(chunk))
+        collector.stop_stream()
+        collector.close()
+
+    live = np.concatenate(processed)
+    offline = pipeline.apply(np.concatenate(received))
+    print("Processed", sum(map(len, received)), "samples in", len(received), "chunks into", len(live), "samples,",
+          "identical to processing at once:", np.array_equal(live, offline))
@@ -0,0 +1,128 @@
+# Trigger-based capture of gestures from a continuous stream.
+# The device streams its readings into a ring buffer while a detector compares every chunk to a
+# running ambient baseline. A gesture starts when a photodiode deviates from the baseline and ends
+# when all of them have been back for a while, after which it is cut out of the ring buffer together
+# with some context before and after it.
+
+import time
+import numpy as np
+from gesture_data import GestureData
+
+TRIGGER_LEVEL = 20 # Deviation from the baseline in readings that starts a gesture.
+HOLD_TIME = 150 # Milliseconds all photodiodes must be back at the baseline before a gesture ends.
+BASELINE_TIME = 500 # Milliseconds over which the baseline follows the ambient readings.
+PRE_TRIGGER = 200 # Milliseconds of context kept before the start of a gesture.
+POST_TRIGGER = 200 # Milliseconds of context kept after the end of a gesture.
+MAX_DURATION = 4000 # Gestures are cut off after this many milliseconds.
+CHUNK_SAMPLES = 256 # Maximum samples read and processed at once.
+
+
+class RingBuffer:
+    """Fixed size buffer of the last samples of a stream.
+
+    Samples are addressed by their index in the stream, of which the last `capacity` can be read.
+    """
+
+    def __init__(self, capacity: int):
+        self.buffer = np.zeros((capacity, 3), dtype=np.uint16)
+        self.capacity = capacity
+        self.written = 0 # Samples written since the start of the stream.
+
+    def write(self, samples: np.ndarray) -> None:
+        skipped = max(len(samples) - self.capacity, 0) # Samples that would be overwritten right away.
+        samples = samples[skipped:]
+        position = (self.written + skipped) % self.capacity
+        first = min(len(samples), self.capacity - position)
+        self.buffer[position:position + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.written += skipped + len(samples)
+
+    # Copies the samples from start up to end (stream indices) out of the buffer.
+    def read(self, start: int, end: int) -> np.ndarray:
+        if start < self.written - self.capacity or end > self.written:
+            raise Exception("Samples " + str(start) + " to " + str(end) + " are not in the ring buffer.")
+        return self.buffer[np.arange(start, end) % self.capacity]
+
+
+class TriggerDetector:
+    """Detects the start and end of gestures in chunks of a stream.
+
+    Every chunk is compared to the baseline at once. While no gesture is going on, the baseline
+    follows the mean of the chunks, so slow changes of the ambient light are not seen as gestures.
+    """
+
+    def __init__(self, sample_rate: int, level=TRIGGER_LEVEL, hold=HOLD_TIME, max_duration=MAX_DURATION,
+                 baseline_time=BASELINE_TIME):
+        self.level = level
+        self.hold = int(hold * sample_rate / 1000)
+        self.max_samples = int(max_duration * sample_rate / 1000)
+        self.baseline_samples = max(int(baseline_time * sample_rate / 1000), 1)
+        self.baseline = None
+        self.onset = None # Stream index of the start of the current gesture.
+        self.last_active = None # Stream index of the last sample that deviated from the baseline.
+
+    # Processes a chunk that starts at the given stream index.
+    # Returns the (onset, offset) of the gesture that ended in this chunk, or None.
+    def process(self, chunk: np.ndarray, start: int):
+        if len(chunk) == 0:
+            return None
+        chunk = chunk.astype(np.float32)
+        if self.baseline is None:
+            self.baseline = np.median(chunk, axis=0)
+
+        active = np.flatnonzero(np.max(np.abs(chunk - self.baseline), axis=1) >= self.level)
+        if self.onset is None:
+            if len(active) == 0:
+                weight = min(len(chunk) / self.baseline_samples, 1)
+                self.baseline += weight * (chunk.mean(axis=0) - self.baseline)
+                return None
+            self.onset = start + int(active[0])
+
+        if len(active):
+            self.last_active = start + int(active[-1])
+        end = start + len(chunk)
+        if end - self.last_active - 1 >= self.hold or end - self.onset >= self.max_samples:
+            gesture = (self.onset, min(self.last_active + 1, self.onset + self.max_samples))
+            self.onset = self.last_active = None
+            return gesture
+        return None
+
+
+# Streams from the device and returns the first count gestures, each with context around it.
+# on_gesture is called with every gesture as soon as it is captured.
+def capture(collector, sample_rate: int, count=1, pre=PRE_TRIGGER, post=POST_TRIGGER, level=TRIGGER_LEVEL,
+            hold=HOLD_TIME, max_duration=MAX_DURATION, timeout=None, on_gesture=None) -> list[GestureData]:
+    pre_samples = int(pre * sample_rate / 1000)
+    post_samples = int(post * sample_rate / 1000)
+    ring = RingBuffer(pre_samples + int((max_duration + hold) * sample_rate / 1000) + post_samples + CHUNK_SAMPLES)
+    detector = TriggerDetector(sample_rate, level, hold, max_duration)
+
+    gestures = []
+    pending = [] # Gestures of which the context after it is still being received.
+    collector.start_stream(sample_rate)
+    start = time.time()
+    try:
+        while len(gestures) < count and (timeout is None or time.time() - start < timeout):
+            chunk = collector.read_samples(CHUNK_SAMPLES)
+            position = ring.written
+            ring.write(chunk)
+
+            gesture = detector.process(chunk, position)
+            if gesture is not None:
+                pending.append(gesture)
+                print("Gesture detected from sample", gesture[0], "to", gesture[1])
+
+            while pending and ring.written >= pending[0][1] + post_samples and len(gestures) < count:
+                onset, offset = pending.pop(0)
+                first = max(onset - pre_samples, 0, ring.written - ring.capacity)
+                data = GestureData(resistance=collector.resistance, sample_rate=sample_rate, duration=0)
+                data.data = ring.read(first, offset + post_samples)
+                data.samples = len(data.data)
+                data.duration = data.samples / sample_rate
+                data.device = collector.serial_port
+                gestures.append(data)
+                if on_gesture is not None:
+                    on_gesture(data)
+    finally:
+        collector.stop_stream()
+    return gestures
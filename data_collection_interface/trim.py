@@ -0,0 +1,133 @@
+# Offline trimming of recordings to the window in which the gesture is performed.
+# Like FormatData._compute_thresholds_from_data, the readings at the start and end of a recording
+# are taken as constant ambient readings; the active region lies between the first and last sample
+# at which a photodiode deviates from them. Regions are detected for whole batches of recordings at
+# once and stored in an index by recording hash, the recordings themselves are never changed.
+
+import os
+import json
+import numpy as np
+from gesture_data import COLLECTION_PATH, GestureData
+
+TRIM_PATH = "./trim/offsets.json"
+TOLERANCE = 5 # Deviation in readings from the ambient reading that counts as activity, like BOUNDARY_TOLERANCE of formatting_data.py.
+REFERENCE_SAMPLES = 5 # Samples at the start and end of which the median is the ambient reading.
+SMOOTHING = 5 # Samples in the moving average applied before detection, so single noisy samples are ignored.
+MARGIN = 100 # Default context kept around the active region, in milliseconds.
+
+
+# Moving average over the time axis of a batch of shape (n, length, 3), keeping the length.
+def smooth(batch: np.ndarray, window=SMOOTHING) -> np.ndarray:
+    if window <= 1 or batch.shape[1] < window:
+        return batch
+    totals = np.cumsum(batch, axis=1)
+    averaged = (totals[:, window - 1:] - np.concatenate([np.zeros_like(totals[:, :1]), totals[:, :-window]], axis=1)) / window
+    return np.concatenate([averaged[:, :1].repeat(window - 1, axis=1), averaged], axis=1)
+
+
+# Finds the active region of a batch of recordings of the same length, with shape (n, length, 3).
+# Returns the start and end (exclusive) sample of every recording.
+# Recordings in which nothing happens keep their whole length.
+def active_regions(batch: np.ndarray, tolerance=TOLERANCE) -> tuple[np.ndarray, np.ndarray]:
+    batch = np.asarray(batch, dtype=np.float32)
+    length = batch.shape[1]
+    if length == 0:
+        # Recordings without samples have no active region.
+        return np.zeros(len(batch), dtype=int), np.zeros(len(batch), dtype=int)
+    batch = smooth(batch)
+    start_reference = np.median(batch[:, :REFERENCE_SAMPLES], axis=1, keepdims=True)
+    end_reference = np.median(batch[:, -REFERENCE_SAMPLES:], axis=1, keepdims=True)
+
+    # Samples at which any photodiode left the ambient reading of the start or end.
+    leading = np.any(np.abs(batch - start_reference) >= tolerance, axis=2)
+    trailing = np.any(np.abs(batch - end_reference) >= tolerance, axis=2)
+
+    starts = np.where(leading.any(axis=1), leading.argmax(axis=1), 0)
+    ends = np.where(trailing.any(axis=1), length - trailing[:, ::-1].argmax(axis=1), length)
+    idle = ends <= starts
+    return np.where(idle, 0, starts), np.where(idle, length, ends)
+
+
+class TrimIndex:
+    """Active regions of recordings by hash, stored in a json file.
+
+    Regions are stored without margin, so any margin can be applied when the recordings are used.
+    The index is recomputed from scratch when the tolerance changes.
+    """
+
+    def __init__(self, path=TRIM_PATH, tolerance=TOLERANCE):
+        self.path = path
+        self.tolerance = tolerance
+        self.regions = {}
+        self.changed = False
+        if os.path.exists(path):
+            with open(path) as file:
+                stored = json.load(file)
+            if stored.get("tolerance") == tolerance:
+                self.regions = stored["regions"]
+
+    # Returns the (start, end) region of every recording, detecting those that are not in the index yet.
+    def offsets(self, recordings: list[GestureData]) -> list[tuple[int, int]]:
+        keys = [recording.hash or recording.fingerprint() for recording in recordings]
+
+        # Group the missing recordings by length, so every group is detected at once.
+        groups = {}
+        for key, recording in zip(keys, recordings):
+            if key not in self.regions:
+                groups.setdefault(len(recording.data), {})[key] = recording
+        for group in groups.values():
+            batch = np.stack([np.asarray(recording.data) for recording in group.values()])
+            starts, ends = active_regions(batch, self.tolerance)
+            self.regions.update(zip(group, zip(starts.tolist(), ends.tolist())))
+            self.changed = True
+
+        return [tuple(self.regions[key]) for key in keys]
+
+    # The samples of the active region with a margin (in milliseconds) around it, as a view of the data.
+    def view(self, recording: GestureData, margin=MARGIN) -> np.ndarray:
+        start, end = self.offsets([recording])[0]
+        return trim(np.asarray(recording.data), start, end, margin, recording.sample_rate)
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w") as file:
+            json.dump({"tolerance": self.tolerance, "regions": self.regions}, file)
+        os.replace(self.path + ".tmp", self.path)
+        self.changed = False
+
+
+# Cuts a region with a margin (in milliseconds) out of the samples, without copying them.
+def trim(data: np.ndarray, start: int, end: int, margin=MARGIN, sample_rate=100) -> np.ndarray:
+    extra = int(round(margin * sample_rate / 1000))
+    return data[max(start - extra, 0):min(end + extra, len(data))]
+
+
+# If running as script, detect the active regions of the whole dataset and report how much can be trimmed.
+if __name__ == "__main__":
+    import time
+    import argparse
+    from loader import discover_files, load_files
+
+    parser = argparse.ArgumentParser(description="Detect the active region of every recording in the dataset.")
+    parser.add_argument("--folder", default=COLLECTION_PATH, help="Root folder of the dataset.")
+    parser.add_argument("--index", default=TRIM_PATH, help="File to store the regions in.")
+    parser.add_argument("--margin", type=int, default=MARGIN, help="Context kept around the region in milliseconds.")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    index = TrimIndex(args.index)
+    total = kept = recordings = 0
+    for path, gestures in load_files([entry["path"] for entry in discover_files(args.folder)], args.workers):
+        for gd, (begin, end) in zip(gestures, index.offsets(gestures)):
+            total += len(gd.data)
+            kept += len(trim(np.asarray(gd.data), begin, end, args.margin, gd.sample_rate))
+        recordings += len(gestures)
+    index.save()
+
+    print("Trimmed", recordings, "recordings in", round(time.time() - start, 2), "seconds, keeping", kept, "of", total,
+          "samples (" + str(round(kept / max(total, 1) * 100, 1)) + "%) with a margin of", args.margin, "ms.")
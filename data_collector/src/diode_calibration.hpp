@@ -89,6 +89,28 @@ class LightIntensityRegulator {
       return this->powerSet[this->resistor_index].value;
     }
 
+    // Search the resistor configuration again for the current lighting.
+    // Reuses the power set, so the regulator does not have to be rebuilt.
+    void reconfigure() {
+      this->resistor_index = 0;
+      this->initialConfiguration();
+    }
+
+    // Directly use the configuration with the resistance closest to the given value, without searching.
+    // Returns the resistance that has been set.
+    int set_resistance(float resistance) {
+      int closest = 0;
+      for (int i = 1; i < this->size; i++) {
+        if (fabs(this->powerSet[i].value - resistance) < fabs(this->powerSet[closest].value - resistance)) {
+          closest = i;
+        }
+      }
+
+      this->resistor_index = closest;
+      set_resistor(this->powerSet[this->resistor_index].pins);
+      return this->get_resistance();
+    }
+
   private:
     int resistor_index;
     int size;
@@ -14,6 +14,73 @@ LightIntensityRegulator* regulator;
 uint16_t SAMPLE_RATE = 100; 
 uint32_t SAMPLE_RATE_DELAY_MICROS = 1000000 / SAMPLE_RATE;
 
+// Protocol used for binary responses, can be changed over the serial interface.
+// Raw sends the bare readings, framed sends them in blocks with a header and a CRC.
+const uint8_t PROTOCOL_RAW = 0;
+const uint8_t PROTOCOL_FRAMED = 1;
+uint8_t PROTOCOL = PROTOCOL_RAW;
+
+// Frames of the framed protocol, see data_collection_interface/framing.py for the layout.
+const uint8_t FRAME_SYNC[] = {0xA5, 0x5A};
+const uint8_t FRAME_SAMPLES = 16;
+uint16_t frameSamples[FRAME_SAMPLES * 3];
+uint8_t frameCount = 0; // Samples in the current frame.
+uint32_t frameIndex = 0; // Index of the first sample of the current frame.
+
+// CRC-16/CCITT-FALSE, pass the result of the previous call as crc to continue a checksum.
+uint16_t crc16(const uint8_t* data, size_t length, uint16_t crc = 0xFFFF) {
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t) data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// Sends the samples collected in the current frame, if there are any.
+void sendFrame() {
+  if (frameCount == 0) {
+    return;
+  }
+
+  const size_t payload = frameCount * 3 * sizeof(uint16_t);
+  uint16_t crc = crc16((uint8_t*) &frameIndex, sizeof(frameIndex));
+  crc = crc16(&frameCount, sizeof(frameCount), crc);
+  crc = crc16((uint8_t*) frameSamples, payload, crc);
+
+  Serial.write(FRAME_SYNC, sizeof(FRAME_SYNC));
+  Serial.write((uint8_t*) &frameIndex, sizeof(frameIndex));
+  Serial.write(&frameCount, sizeof(frameCount));
+  Serial.write((uint8_t*) frameSamples, payload);
+  Serial.write((uint8_t*) &crc, sizeof(crc));
+
+  frameIndex += frameCount;
+  frameCount = 0;
+}
+
+// Commands can be sent in an envelope with an id (see envelopeCommand), they are then acknowledged
+// in binary instead of with a line of text: ACK_MARKER | id (uint8) | status (uint8) | value (uint32)
+const uint8_t ACK_MARKER = 0xA6;
+const uint8_t ACK_OK = 0;
+const uint8_t ACK_UNKNOWN = 1;
+bool enveloped = false; // Whether the command that is being handled came in an envelope.
+uint8_t commandId = 0; // Id of the command that is being handled, if it came in an envelope.
+
+// Acknowledges the command that is being handled with a value, if it came in an envelope.
+// Returns false if it did not, then the command confirms itself with a line of text.
+bool acknowledge(uint32_t value, uint8_t status = ACK_OK) {
+  if (!enveloped) {
+    return false;
+  }
+
+  Serial.write(ACK_MARKER);
+  Serial.write(commandId);
+  Serial.write(status);
+  Serial.write((uint8_t*) &value, sizeof(value));
+  return true;
+}
+
 // Helper funtion to read and return a value from the serial.
 // Wrap it into its own type (template)
 template <typename T>
@@ -37,9 +104,20 @@ void readPhotodiodes() {
   uint16_t r2 = (uint16_t) analogRead(A2);
 
   #ifdef BINARY_RESPONE
-    Serial.write((char*) &r0, sizeof(uint16_t));
-    Serial.write((char*) &r1, sizeof(uint16_t));
-    Serial.write((char*) &r2, sizeof(uint16_t));
+    if (PROTOCOL == PROTOCOL_FRAMED) {
+      uint16_t* sample = &frameSamples[frameCount * 3];
+      sample[0] = r0;
+      sample[1] = r1;
+      sample[2] = r2;
+      frameCount++;
+      if (frameCount == FRAME_SAMPLES) {
+        sendFrame();
+      }
+    } else {
+      Serial.write((char*) &r0, sizeof(uint16_t));
+      Serial.write((char*) &r1, sizeof(uint16_t));
+      Serial.write((char*) &r2, sizeof(uint16_t));
+    }
   #else
     Serial.print(r0);
     Serial.print(", ");
@@ -67,23 +145,79 @@ void measurementCommand() {
     getValueFromSerial(&samples);
 
     // Read the photodiodes for the amount of samples.
+    frameIndex = 0;
+    frameCount = 0;
     for (uint32_t i = 0; i < samples; i++) {
       readPhotodiodes();
     }
+
+    // Send the last, partially filled, frame.
+    if (PROTOCOL == PROTOCOL_FRAMED) {
+      sendFrame();
+    }
   
-    Serial.println("Finished measuring command.");
+    if (!acknowledge(samples)) {
+      Serial.println("Finished measuring command.");
+    }
+}
+
+// Command start of a continuous measurement.
+// Samples at the sample rate that is currently set until STREAM_STOP is received.
+// Sample indices in the framed protocol keep counting for the whole stream.
+const char STREAM_START = 0xB0;
+const char STREAM_STOP = 0xB1;
+void streamCommand() {
+    setLedGreen();
+
+    frameIndex = 0;
+    frameCount = 0;
+    while (true) {
+      // Other bytes are ignored, no other commands can be handled while streaming.
+      if (Serial.available() > 0 && (char) Serial.read() == STREAM_STOP) {
+        break;
+      }
+      readPhotodiodes();
+    }
+
+    // Send the last, partially filled, frame.
+    if (PROTOCOL == PROTOCOL_FRAMED) {
+      sendFrame();
+    }
+
+    if (!acknowledge(0)) {
+      Serial.println("Finished streaming command.");
+    }
 }
 
 // Command recalibration of resistor values.
 const char RECALIBRATE = 0xAC;
 void recalibrateCommand () {
     setLedOrange();
-    // regulator->reconfigure();
-    // Create a new light regulator.
-    regulator = new LightIntensityRegulator();
+    // Search a new configuration with the existing regulator, creating a new one would leak the old one.
+    regulator->reconfigure();
   
     // Return the resistance that has been set.
-    Serial.println(regulator->get_resistance()); 
+    uint32_t resistance = regulator->get_resistance();
+    if (!acknowledge(resistance)) {
+      Serial.println(resistance);
+    }
+}
+
+
+// Directly apply a known resistor configuration, for example one found by an earlier recalibration.
+// Expects 4 bytes (uint32_t) that represent the resistance in Ohms, the closest configuration is used.
+const char SET_RESISTANCE = 0xAF;
+void setResistanceCommand() {
+  setLedOrange();
+
+  uint32_t resistance = 0;
+  getValueFromSerial(&resistance);
+
+  // Return the resistance that has been set.
+  resistance = regulator->set_resistance(resistance);
+  if (!acknowledge(resistance)) {
+    Serial.println(resistance);
+  }
 }
 
 
@@ -101,11 +235,35 @@ void setSampleRateCommand() {
   SAMPLE_RATE = sample_rate;
   SAMPLE_RATE_DELAY_MICROS = 1000000 / SAMPLE_RATE;
 
-  Serial.print("Sample rate set to: ");
-  Serial.print(sample_rate);
-  Serial.println(" Hz");
+  if (!acknowledge(sample_rate)) {
+    Serial.print("Sample rate set to: ");
+    Serial.print(sample_rate);
+    Serial.println(" Hz");
+  }
 }
 
+// Set the protocol used for binary responses.
+// Expects 1 byte (uint8_t), PROTOCOL_RAW or PROTOCOL_FRAMED.
+const char SET_PROTOCOL = 0xAE;
+void setProtocolCommand() {
+  setLedBlue();
+
+  uint8_t protocol = PROTOCOL_RAW;
+  getValueFromSerial(&protocol);
+  PROTOCOL = protocol;
+
+  if (!acknowledge(PROTOCOL)) {
+    Serial.print("Protocol set to: ");
+    Serial.println(PROTOCOL == PROTOCOL_FRAMED ? "framed" : "raw");
+  }
+}
+
+// Handle a command that is sent in an envelope, it is acknowledged in binary with the id it was sent with.
+// Expects 1 byte (uint8_t) id, followed by the command byte and its arguments.
+// Several envelopes can be sent at once, they are handled and acknowledged in order.
+const char ENVELOPE = 0xB2;
+void envelopeCommand();
+
 // Make a map that contains the different commands that we can receive from the serial.
 // and the functions that we should call when we receive them.
 typedef void (*command_function)();
@@ -114,9 +272,32 @@ command_map commands =
 {
   {MEASUREMENT_START, measurementCommand},
   {RECALIBRATE, recalibrateCommand},
-  {SET_SAMPLE_RATE, setSampleRateCommand}
+  {SET_SAMPLE_RATE, setSampleRateCommand},
+  {SET_PROTOCOL, setProtocolCommand},
+  {SET_RESISTANCE, setResistanceCommand},
+  {STREAM_START, streamCommand},
+  {ENVELOPE, envelopeCommand}
 };
 
+void envelopeCommand() {
+  uint8_t id = 0;
+  getValueFromSerial(&id);
+  char command = 0;
+  getValueFromSerial(&command);
+
+  enveloped = true;
+  commandId = id;
+
+  // Envelopes can not be nested.
+  command_function function = command != ENVELOPE ? commands[command] : NULL;
+  if (function != NULL) {
+    function();
+  } else {
+    acknowledge(0, ACK_UNKNOWN);
+  }
+  enveloped = false;
+}
+
 // Function that processes a command that we received from the serial.
 // If the command is not in the map, we print an error message.
 void processCommand(char command) {